@@ -1,26 +1,46 @@
-from typing import List, Dict
-from openai import AsyncOpenAI
+from typing import Any, Callable, List, Dict, Optional
 from datetime import datetime
-import json
+from llm_gateway import LLMGateway, get_llm_gateway
+from prompt_builder import build_prompt, compact_json, compact_profile, PROMPT_DATA_TOKEN_BUDGET
+from stream_parser import validate_fields
+
+# Schemi delle risposte JSON (stesse chiavi dei risultati di fallback)
+SUGGESTIONS_SCHEMA = {
+    "profile_improvements": list,
+    "skill_development": list,
+    "market_positioning": list,
+    "pricing_strategy": list,
+    "portfolio_enhancement": list
+}
+LEARNING_PATH_SCHEMA = {
+    "short_term": dict,
+    "medium_term": dict,
+    "long_term": dict
+}
+MARKET_INSIGHT_SCHEMA = {
+    "description": str,
+    "opportunity": str,
+    "action_items": list
+}
 
 class AIAdvisor:
-    def __init__(self, openai_api_key: str):
-        self.client = AsyncOpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, gateway: Optional[LLMGateway] = None):
+        self.gateway = gateway or get_llm_gateway(openai_api_key)
 
     async def generate_profile_suggestions(self, profile_data: Dict, analysis_result: Dict) -> Dict:
         """
         Genera suggerimenti personalizzati per il profilo freelancer
         """
         try:
-            prompt = f"""
+            prompt = build_prompt(f"""
             Analizza questo profilo freelancer e i risultati dell'analisi per generare suggerimenti
             altamente personalizzati e actionable per il mercato GenAI europeo:
 
             PROFILO FREELANCER:
-            {json.dumps(profile_data, indent=2)}
+            {compact_profile(profile_data)}
 
             ANALISI PRECEDENTE:
-            {json.dumps(analysis_result, indent=2)}
+            {compact_json(analysis_result, max_tokens=PROMPT_DATA_TOKEN_BUDGET)}
 
             Genera suggerimenti specifici e dettagliati per le seguenti aree:
             1. Miglioramenti immediati al profilo (3 suggerimenti)
@@ -34,18 +54,18 @@ class AIAdvisor:
             - Motivazione dettagliata
             - Esempio concreto o caso studio
             - Timeline suggerita per l'implementazione
-            """
 
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Sei un esperto advisor per freelancer GenAI nel mercato europeo."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            Rispondi con un oggetto JSON con le chiavi "profile_improvements", "skill_development",
+            "market_positioning", "pricing_strategy" e "portfolio_enhancement". Ogni chiave contiene
+            una lista di oggetti con "action", "reason", "example" e "timeline".
+            """)
 
-            suggestions = self._parse_structured_response(response.choices[0].message.content)
-            return suggestions
+            return await self._json_completion(
+                "Sei un esperto advisor per freelancer GenAI nel mercato europeo. Rispondi in JSON.",
+                prompt,
+                SUGGESTIONS_SCHEMA,
+                call_site="advisor.profile_suggestions"
+            )
 
         except Exception as e:
             print(f"Error generating suggestions: {str(e)}")
@@ -56,12 +76,12 @@ class AIAdvisor:
         Genera insights sul mercato specifici per il profilo
         """
         try:
-            prompt = f"""
+            prompt = build_prompt(f"""
             Analizza questo profilo freelancer e genera insights approfonditi sul mercato GenAI
             europeo specifici per le sue competenze:
 
             PROFILO:
-            {json.dumps(profile_data, indent=2)}
+            {compact_profile(profile_data)}
 
             Fornisci insights dettagliati su:
             1. Trend di mercato rilevanti nel 2024
@@ -75,17 +95,21 @@ class AIAdvisor:
             - Dati specifici e statistiche (se disponibili)
             - Esempi concreti di aziende o progetti
             - Suggerimenti pratici per sfruttare l'opportunità
-            """
 
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Sei un esperto analista del mercato GenAI europeo."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            Rispondi con un oggetto JSON in cui ogni chiave è il nome di un insight e il valore è
+            un oggetto con "description", "opportunity" (stringhe) e "action_items" (lista di stringhe).
+            """)
 
-            insights = self._parse_structured_response(response.choices[0].message.content)
+            insights = await self._json_completion(
+                "Sei un esperto analista del mercato GenAI europeo. Rispondi in JSON.",
+                prompt,
+                None,
+                call_site="advisor.market_insights"
+            )
+            for insight in insights.values():
+                if not isinstance(insight, dict):
+                    raise ValueError("Insight non valido nella risposta")
+                validate_fields(insight, MARKET_INSIGHT_SCHEMA)
             return insights
 
         except Exception as e:
@@ -97,15 +121,15 @@ class AIAdvisor:
         Genera un percorso di apprendimento personalizzato
         """
         try:
-            prompt = f"""
+            prompt = build_prompt(f"""
             Crea un percorso di apprendimento dettagliato e personalizzato per questo freelancer
             basato sul suo profilo e l'analisi delle competenze:
 
             PROFILO:
-            {json.dumps(profile_data, indent=2)}
+            {compact_profile(profile_data)}
 
             ANALISI:
-            {json.dumps(analysis_result, indent=2)}
+            {compact_json(analysis_result, max_tokens=PROMPT_DATA_TOKEN_BUDGET)}
 
             Genera un piano di apprendimento completo che includa:
             1. Obiettivi a breve termine (1-3 mesi)
@@ -122,61 +146,40 @@ class AIAdvisor:
             - Risorse necessarie
             - Risultati attesi
             - Modo di misurare il successo
-            """
 
-            response = await self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Sei un esperto coach per sviluppatori GenAI."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            Rispondi con un oggetto JSON con le chiavi "short_term", "medium_term" e "long_term".
+            Ognuna contiene "timeline" e "objectives": una lista di oggetti con "title", "resources",
+            "project", "certifications" e "kpi".
+            """)
 
-            learning_path = self._parse_structured_response(response.choices[0].message.content)
-            return learning_path
+            return await self._json_completion(
+                "Sei un esperto coach per sviluppatori GenAI. Rispondi in JSON.",
+                prompt,
+                LEARNING_PATH_SCHEMA,
+                call_site="advisor.learning_path"
+            )
 
         except Exception as e:
             print(f"Error generating learning path: {str(e)}")
             return self._get_fallback_learning_path()
 
-    def _parse_structured_response(self, response: str) -> Dict:
+    async def _json_completion(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema: Optional[Dict],
+        call_site: str = "advisor",
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        model: str = "gpt-4"
+    ) -> Dict:
         """
-        Parse strutturato della risposta di GPT-4
+        Chiamata a GPT-4 tramite il gateway LLM condiviso, con output JSON
+        in streaming validato rispetto a `schema`
         """
-        try:
-            sections = response.split('\n\n')
-            parsed_response = {}
-            
-            current_section = None
-            current_items = []
-            
-            for section in sections:
-                if ':' in section and not section.startswith('-'):
-                    if current_section and current_items:
-                        parsed_response[current_section] = current_items
-                        current_items = []
-                    
-                    title, content = section.split(':', 1)
-                    current_section = title.strip()
-                    
-                    # Controlla se c'è contenuto dopo i due punti
-                    if content.strip():
-                        current_items.append(content.strip())
-                        
-                elif section.strip().startswith('-'):
-                    current_items.append(section.strip()[2:])  # Rimuovi il trattino
-                elif current_section:
-                    current_items.append(section.strip())
-            
-            # Aggiungi l'ultima sezione
-            if current_section and current_items:
-                parsed_response[current_section] = current_items
-
-            return parsed_response
-
-        except Exception as e:
-            print(f"Error parsing GPT-4 response: {str(e)}")
-            return {}
+        return await self.gateway.chat_json([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ], model=model, call_site=call_site, schema=schema, on_field=on_field)
 
     def _get_fallback_suggestions(self) -> Dict:
         """
@@ -0,0 +1,92 @@
+"""
+Benchmark del profilo di storage SQLite.
+Confronta l'engine di default (rollback journal, pool standard) con il profilo
+configurato in database.py (WAL, pragmas, pool dimensionato) su un database
+temporaneo, con scrittori e lettori concorrenti come le richieste dell'API.
+
+Uso: python benchmark_storage.py [scrittori] [letture_per_scrittura] [operazioni_per_thread]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from database import Base, FreelancerModel, DB_POOL_OPTIONS, SQLITE_PRAGMAS, configure_sqlite_engine
+
+WRITERS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+READERS_PER_WRITER = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+OPS_PER_THREAD = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+def build_engine(url: str, tuned: bool):
+    if tuned:
+        return configure_sqlite_engine(create_engine(url, connect_args={"check_same_thread": False}, **DB_POOL_OPTIONS))
+    # Engine del vecchio database.py (timeout sqlite3 di default: 5s)
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+def run(tuned: bool) -> dict:
+    directory = tempfile.mkdtemp()
+    engine = build_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", tuned)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+
+    def count(key: str) -> None:
+        with lock:
+            counts[key] += 1
+
+    def writer(worker: int) -> None:
+        for i in range(OPS_PER_THREAD):
+            db = Session()
+            try:
+                # Una transazione per richiesta, come create_profile / register_user
+                db.add(FreelancerModel(email=f"w{worker}-{i}@bench.it", skills=["python"], experience="bench"))
+                db.commit()
+                count("writes")
+            except OperationalError:
+                db.rollback()
+                count("locked")
+            finally:
+                db.close()
+
+    def reader(worker: int) -> None:
+        for i in range(OPS_PER_THREAD):
+            db = Session()
+            try:
+                db.query(FreelancerModel).filter(FreelancerModel.email == f"w{worker % WRITERS}-{i}@bench.it").first()
+                db.query(FreelancerModel.id).limit(50).all()
+                count("reads")
+            except OperationalError:
+                count("locked")
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(WRITERS)]
+    threads += [threading.Thread(target=reader, args=(r,)) for r in range(WRITERS * READERS_PER_WRITER)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+    return {
+        **counts,
+        "seconds": elapsed,
+        "writes_per_sec": counts["writes"] / elapsed,
+        "reads_per_sec": counts["reads"] / elapsed
+    }
+
+if __name__ == "__main__":
+    print(f"{WRITERS} scrittori, {WRITERS * READERS_PER_WRITER} lettori, {OPS_PER_THREAD} operazioni per thread")
+    print(f"Profilo: {SQLITE_PRAGMAS}")
+    for name, tuned in (("default", False), ("profilo", True)):
+        result = run(tuned)
+        print(
+            f"{name:>8}: {result['writes_per_sec']:8.0f} scritture/s  {result['reads_per_sec']:8.0f} letture/s  "
+            f"{result['locked']:5d} 'database is locked'  ({result['seconds']:.2f}s)"
+        )
@@ -0,0 +1,93 @@
+"""
+Import ed export in blocco tramite l'API, così il server in esecuzione
+aggiorna anche gli indici in memoria (skill, vettori, prescoring).
+Il file viene inviato e ricevuto in streaming, senza caricarlo in memoria.
+
+Uso:
+  python bulk_cli.py import <freelancers|projects|companies> <file|-> [--format ndjson|csv]
+  python bulk_cli.py export <freelancers|projects|companies> [file] [--format ndjson|csv]
+  python bulk_cli.py token
+
+Il token JWT si legge da MAIGENAI_TOKEN (o --token), l'URL da MAIGENAI_API_URL.
+Serve un token di servizio: `token` ne genera uno firmato con JWT_SECRET, da eseguire
+dove il segreto del server è disponibile.
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import BinaryIO, Iterator
+import httpx
+
+API_URL = os.getenv("MAIGENAI_API_URL", "http://localhost:8000")
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+def read_chunks(stream: BinaryIO) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+def guess_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+def import_file(client: httpx.Client, entity: str, path: str, fmt: str) -> int:
+    stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        response = client.post(f"/api/bulk/{entity}/import", params={"format": fmt}, content=read_chunks(stream))
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    response.raise_for_status()
+    summary = response.json()
+    for error in summary["errors"]:
+        print(f"riga {error['row']}: {error['error']}", file=sys.stderr)
+    print(json.dumps({key: value for key, value in summary.items() if key != "errors"}))
+    return 1 if summary["failed"] else 0
+
+def export_file(client: httpx.Client, entity: str, path: str, fmt: str) -> int:
+    output = sys.stdout.buffer if path == "-" else open(path, "wb")
+    try:
+        with client.stream("GET", f"/api/bulk/{entity}/export", params={"format": fmt}) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return 0
+
+def service_token() -> str:
+    # Importato qui: import ed export non richiedono il codice del server
+    from routers.auth import create_service_token
+    return create_service_token("bulk_cli")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Import/export in blocco di freelancer, progetti e aziende")
+    parser.add_argument("command", choices=["import", "export", "token"])
+    parser.add_argument("entity", nargs="?", choices=["freelancers", "projects", "companies"])
+    parser.add_argument("path", nargs="?", default="-", help="file da leggere/scrivere, '-' per stdin/stdout")
+    parser.add_argument("--format", choices=["ndjson", "csv"])
+    parser.add_argument("--token", default=os.getenv("MAIGENAI_TOKEN"))
+    parser.add_argument("--url", default=API_URL)
+    args = parser.parse_args()
+    if args.command == "token":
+        print(service_token())
+        return 0
+    if not args.entity:
+        parser.error("entità mancante: freelancers, projects o companies")
+    if not args.token:
+        parser.error("token JWT mancante: usa --token o MAIGENAI_TOKEN")
+
+    fmt = args.format or guess_format(args.path)
+    headers = {"Authorization": f"Bearer {args.token}"}
+    # Nessun timeout di lettura: l'import di un catalogo grande può richiedere minuti
+    with httpx.Client(base_url=args.url, headers=headers, timeout=httpx.Timeout(30.0, read=None)) as client:
+        if args.command == "import":
+            return import_file(client, args.entity, args.path, fmt)
+        return export_file(client, args.entity, args.path, fmt)
+
+if __name__ == "__main__":
+    sys.exit(main())
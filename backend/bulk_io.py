@@ -0,0 +1,124 @@
+from typing import Any, AsyncIterator, Dict, Iterable, List, Sequence, Tuple, Union
+import codecs
+import csv
+import io
+import json
+from serialization import dumps
+
+# Formati di import/export: un oggetto JSON per riga oppure CSV con intestazione
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Nel CSV le liste (skill) sono separate da ";" e gli oggetti (portfolio) sono JSON
+CSV_LIST_SEPARATOR = ";"
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Split a byte stream into text lines without buffering the whole body
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+def _csv_value(field: str, value: str, list_fields: Sequence[str], json_fields: Sequence[str]) -> Any:
+    if field in json_fields:
+        return json.loads(value)
+    if field in list_fields:
+        return [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+    return value
+
+async def iter_records(
+    lines: AsyncIterator[str],
+    fmt: str,
+    list_fields: Sequence[str] = (),
+    json_fields: Sequence[str] = ()
+) -> AsyncIterator[Tuple[int, Union[Dict, str]]]:
+    """
+    (row number, record) pairs from NDJSON or CSV lines; a malformed row
+    yields its error message instead of the record. Empty CSV cells are
+    left out so the schema defaults apply.
+    """
+    if fmt == "ndjson":
+        row = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row, f"JSON non valido: {e}"
+                continue
+            yield row, record if isinstance(record, dict) else "Ogni riga deve essere un oggetto JSON"
+        return
+
+    header: List[str] = []
+    pending = ""
+    row = 0
+    async for line in lines:
+        # Un record CSV può estendersi su più righe dentro un campo tra virgolette
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if not header:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        if len(values) != len(header):
+            yield row, f"Attese {len(header)} colonne, trovate {len(values)}"
+            continue
+        try:
+            yield row, {
+                field: _csv_value(field, value, list_fields, json_fields)
+                for field, value in zip(header, values)
+                if value != ""
+            }
+        except ValueError as e:
+            yield row, f"JSON non valido: {e}"
+    if pending:
+        yield row + 1, "Campo tra virgolette non chiuso"
+
+def last_per_key(records: List[Tuple[int, Dict]], key: str) -> Tuple[List[Tuple[int, Dict]], Dict[int, int]]:
+    """
+    Keep only the last of the (row, record) pairs sharing a value of `key`,
+    as if they were upserted one after the other; records without the key
+    are all kept. Also return, per kept row, how many records it stands for.
+    """
+    last = {record[key]: row for row, record in records if record.get(key) is not None}
+    kept = [(row, record) for row, record in records if record.get(key) is None or last[record[key]] == row]
+    covers = {row: 0 for row, _ in kept}
+    for row, record in records:
+        covers[row if record.get(key) is None else last[record[key]]] += 1
+    return kept, covers
+
+def encode_rows(rows: Iterable[Dict], fmt: str, fields: Sequence[str]) -> bytes:
+    """
+    Encode one page of export rows; CSV pages carry no header (see csv_header)
+    """
+    if fmt == "ndjson":
+        return b"".join(dumps(row) + b"\n" for row in rows)
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    for row in rows:
+        values = []
+        for field in fields:
+            value = row.get(field)
+            if isinstance(value, list) and all(isinstance(item, str) for item in value):
+                value = CSV_LIST_SEPARATOR.join(value)
+            elif isinstance(value, (list, dict)):
+                value = json.dumps(value, ensure_ascii=False)
+            values.append("" if value is None else value)
+        writer.writerow(values)
+    return output.getvalue().encode("utf-8")
+
+def csv_header(fields: Sequence[str]) -> bytes:
+    return (",".join(fields) + "\n").encode("utf-8")
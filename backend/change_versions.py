@@ -0,0 +1,63 @@
+from typing import Optional
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import TableVersionModel
+
+# Tabelle con versione per tabella (table_versions) e per riga (colonna `version`),
+# incrementate da trigger SQLite: ogni percorso di scrittura le aggiorna
+TRACKED_TABLES = ("freelancers", "projects", "companies")
+
+def create_version_triggers(conn: Connection) -> None:
+    for table in TRACKED_TABLES:
+        conn.exec_driver_sql(
+            f"INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('{table}', 1)"
+        )
+        bump_table = f"UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';"
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_ai AFTER INSERT ON {table} BEGIN {bump_table} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_ad AFTER DELETE ON {table} BEGIN {bump_table} END"
+        )
+        # recursive_triggers è disattivato: l'UPDATE della versione di riga non riattiva il trigger
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_version_au AFTER UPDATE ON {table} "
+            f"WHEN NEW.version IS OLD.version BEGIN "
+            f"UPDATE {table} SET version = coalesce(OLD.version, 0) + 1 WHERE id = NEW.id; {bump_table} END"
+        )
+
+async def table_version(db: AsyncSession, table: str) -> int:
+    return await db.scalar(
+        select(TableVersionModel.version).where(TableVersionModel.table_name == table)
+    ) or 0
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag from the versions and request parameters a response depends on
+    """
+    return '"' + hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest() + '"'
+
+def query_key(request: Request) -> str:
+    # Parametri in ordine canonico, così ?a=1&b=2 e ?b=2&a=1 condividono l'ETag
+    return "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match usa il confronto debole: W/"x" corrisponde a "x"
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # Il browser può conservare la risposta ma deve sempre rivalidarla
+    response.headers["Cache-Control"] = "private, no-cache"
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
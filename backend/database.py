@@ -1,9 +1,69 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, JSON, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, JSON, ForeignKey, Text, LargeBinary, UniqueConstraint, Index, Boolean
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from typing import AsyncIterator, Dict
+import os
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./maigenai.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./maigenai.db"
+
+# Profilo di storage SQLite: WAL permette letture concorrenti a una scrittura,
+# busy_timeout fa attendere le scritture concorrenti invece di fallire con "database is locked"
+SQLITE_PRAGMAS: Dict[str, str] = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),  # sicuro in WAL, fsync solo ai checkpoint
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),  # negativo = KiB, quindi 64 MiB
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+DB_POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30")),
+    "pool_pre_ping": True,
+}
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def configure_sqlite_engine(sync_engine: Engine) -> Engine:
+    """
+    Applica SQLITE_PRAGMAS a ogni nuova connessione del pool
+    """
+    event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+    return sync_engine
+
+engine = configure_sqlite_engine(create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},  # le connessioni del pool passano tra thread
+    **DB_POOL_OPTIONS
+))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Engine async (aiosqlite) per gli handler FastAPI: le query non bloccano l'event loop
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **DB_POOL_OPTIONS)
+configure_sqlite_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency FastAPI: una sessione async per richiesta, chiusa a fine richiesta
+    e con rollback se l'handler solleva un'eccezione
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+
 Base = declarative_base()
 
 class FreelancerModel(Base):
@@ -15,8 +75,9 @@ class FreelancerModel(Base):
     experience = Column(String, default="")
     skills = Column(JSON, default=[])
     portfolio = Column(JSON, default=[])  # Assicurati che sia JSON
-    hourly_rate = Column(Float, nullable=True)
+    hourly_rate = Column(Float, nullable=True, index=True)
     availability = Column(String, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # incrementata da trigger
     
     # Relazione con i progetti
     projects = relationship("ProjectModel", back_populates="freelancer", foreign_keys="ProjectModel.freelancer_email")
@@ -32,6 +93,7 @@ class CompanyModel(Base):
     industry = Column(String)
     size = Column(String)
     location = Column(String)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # incrementata da trigger
     
     # Relazione con i progetti
     projects = relationship("ProjectModel", back_populates="company", foreign_keys="ProjectModel.company_email")
@@ -41,16 +103,147 @@ class ProjectModel(Base):
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     description = Column(String)
-    budget = Column(Float)
+    budget = Column(Float, index=True)
     timeline = Column(String)
     required_skills = Column(JSON, default=[])
     
     # Aggiunta dei campi mancanti
-    company_email = Column(String, ForeignKey("companies.email"), nullable=True)
-    freelancer_email = Column(String, ForeignKey("freelancers.email"), nullable=True)
+    company_email = Column(String, ForeignKey("companies.email"), nullable=True, index=True)
+    freelancer_email = Column(String, ForeignKey("freelancers.email"), nullable=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # incrementata da trigger
     
     # Relazioni
     company = relationship("CompanyModel", back_populates="projects", foreign_keys=[company_email])
     freelancer = relationship("FreelancerModel", back_populates="projects", foreign_keys=[freelancer_email])
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+class SkillModel(Base):
+    __tablename__ = "skills"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)  # normalizzata con skill_index.normalize_skill
+
+class FreelancerSkillModel(Base):
+    __tablename__ = "freelancer_skills"
+    __table_args__ = (
+        Index("ix_freelancer_skills_skill_freelancer", "skill_id", "freelancer_id"),
+    )
+    freelancer_id = Column(Integer, ForeignKey("freelancers.id"), primary_key=True)
+    skill_id = Column(Integer, ForeignKey("skills.id"), primary_key=True)
+
+class ProjectSkillModel(Base):
+    __tablename__ = "project_skills"
+    __table_args__ = (
+        Index("ix_project_skills_skill_project", "skill_id", "project_id"),
+    )
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    skill_id = Column(Integer, ForeignKey("skills.id"), primary_key=True)
+
+class LLMCacheModel(Base):
+    __tablename__ = "llm_cache"
+    key = Column(String, primary_key=True)  # sha256 di modello + prompt normalizzato
+    model = Column(String)
+    response = Column(Text)
+    created_at = Column(Float)
+    expires_at = Column(Float, index=True)
+
+class EmbeddingModel(Base):
+    __tablename__ = "embeddings"
+    __table_args__ = (UniqueConstraint("kind", "entity_id", name="uq_embeddings_kind_entity"),)
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True)  # "freelancer" o "project"
+    entity_id = Column(Integer)
+    embedder = Column(String)
+    content_hash = Column(String)
+    vector = Column(LargeBinary)  # float32 contigui
+
+class MatchJobModel(Base):
+    __tablename__ = "match_jobs"
+    id = Column(String, primary_key=True)  # uuid4 hex
+    status = Column(String, index=True, default="queued")  # queued, running, completed, failed
+    project = Column(JSON)  # ProjectRequirement serializzato
+    min_score = Column(Float, default=0.0)
+    total = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(Float)
+    updated_at = Column(Float)
+
+class MatchJobItemModel(Base):
+    __tablename__ = "match_job_items"
+    __table_args__ = (
+        UniqueConstraint("job_id", "freelancer_id", name="uq_match_job_items_job_freelancer"),
+        Index("ix_match_job_items_job_status", "job_id", "status"),
+        Index("ix_match_job_items_job_score", "job_id", "match_score"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, ForeignKey("match_jobs.id"))
+    freelancer_id = Column(Integer)
+    status = Column(String, default="pending")  # pending, done
+    prescore = Column(JSON)
+    match_score = Column(Float, nullable=True)
+    result = Column(JSON, nullable=True)
+
+class MatchModel(Base):
+    __tablename__ = "matches"
+    __table_args__ = (
+        UniqueConstraint("project_id", "freelancer_id", name="uq_matches_project_freelancer"),
+        Index("ix_matches_project_rank", "project_id", "rank"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id"))
+    freelancer_id = Column(Integer, ForeignKey("freelancers.id"), index=True)
+    rank = Column(Integer)
+    match_score = Column(Float)
+    prescore = Column(Float)
+    result = Column(JSON)
+    computed_at = Column(Float)
+
+class ProjectMatchStateModel(Base):
+    __tablename__ = "project_match_state"
+    project_id = Column(Integer, ForeignKey("projects.id"), primary_key=True)
+    dirty = Column(Boolean, default=True, index=True)
+    dirty_version = Column(Integer, default=0)  # incrementato a ogni modifica
+    dirty_since = Column(Float, nullable=True)
+    refreshed_at = Column(Float, nullable=True)
+
+class MatchHistoryModel(Base):
+    __tablename__ = "match_history"
+    __table_args__ = (
+        Index("ix_match_history_freelancer_created", "freelancer_id", "created_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    freelancer_id = Column(Integer, ForeignKey("freelancers.id"))
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+    project_title = Column(String)
+    source = Column(String)  # find_matches, batch_match
+    match_score = Column(Float)
+    matched_skills = Column(JSON, default=[])
+    created_at = Column(Float)
+
+class FreelancerMatchStatsModel(Base):
+    __tablename__ = "freelancer_match_stats"
+    freelancer_id = Column(Integer, ForeignKey("freelancers.id"), primary_key=True)
+    total_matches = Column(Integer, default=0)
+    successful_matches = Column(Integer, default=0)
+    score_sum = Column(Float, default=0.0)
+    skill_counts = Column(JSON, default={})  # skill normalizzata -> numero di match
+    recent_matches = Column(JSON, default=[])  # ultimi N match, dal più recente
+    updated_at = Column(Float)
+
+class TableVersionModel(Base):
+    __tablename__ = "table_versions"
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # incrementata da trigger a ogni scrittura
+
+class SchemaMigrationModel(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(Float)
+
+class BackfillCheckpointModel(Base):
+    __tablename__ = "backfill_checkpoints"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0)  # ultimo ID processato, per riprendere dopo un'interruzione
+    processed = Column(Integer, default=0)
+    completed = Column(Boolean, default=False)
+    updated_at = Column(Float)
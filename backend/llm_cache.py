@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from database import SessionLocal, LLMCacheModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+class LLMCache:
+    """
+    Content-addressed cache for LLM completions.
+
+    Entries are keyed by a hash of the model name and the normalized prompt
+    messages, kept in an in-memory LRU and persisted to the `llm_cache`
+    table so they survive restarts. The table is read and written in a
+    worker thread, so a memory miss does not block the event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        persist: bool = True
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict]) -> str:
+        """
+        Hash the model name and the prompt messages, ignoring whitespace layout
+        """
+        normalized = [
+            {"role": m["role"], "content": " ".join(str(m["content"]).split())}
+            for m in messages
+        ]
+        payload = json.dumps({"model": model, "messages": normalized}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        if self.persist:
+            value = await asyncio.to_thread(self._load, key, now)
+            if value is not None:
+                self._remember(key, value[0], value[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return value[0]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, model: str = "", ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (ttl_seconds if ttl_seconds is not None else self.ttl_seconds)
+        self._remember(key, value, expires_at)
+        if self.persist:
+            await asyncio.to_thread(self._store, key, value, model, now, expires_at)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        if self.persist:
+            await asyncio.to_thread(self._delete_all)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _delete_all(self) -> None:
+        db = SessionLocal()
+        try:
+            db.query(LLMCacheModel).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def _load(self, key: str, now: float) -> Optional[tuple]:
+        db = SessionLocal()
+        try:
+            row = db.query(LLMCacheModel).filter(LLMCacheModel.key == key).first()
+            if row is None:
+                return None
+            if row.expires_at <= now:
+                db.delete(row)
+                db.commit()
+                return None
+            return row.response, row.expires_at
+        except Exception as e:
+            logger.error(f"Error reading LLM cache: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def _store(self, key: str, value: str, model: str, now: float, expires_at: float) -> None:
+        db = SessionLocal()
+        try:
+            db.merge(LLMCacheModel(
+                key=key,
+                model=model,
+                response=value,
+                created_at=now,
+                expires_at=expires_at
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error writing LLM cache: {str(e)}")
+        finally:
+            db.close()
+
+# Cache condivisa da MaigenAIMatchingSystem e AIAdvisor
+llm_cache = LLMCache()
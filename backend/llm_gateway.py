@@ -0,0 +1,361 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import asyncio
+import logging
+import os
+import random
+import time
+import httpx
+import openai
+from openai import AsyncOpenAI
+from llm_cache import LLMCache, llm_cache
+from singleflight import SingleFlight, llm_singleflight
+from prompt_builder import TokenMeter, token_meter, estimate_tokens
+from stream_parser import IncrementalJSONParser, SchemaType, validate_fields
+
+logger = logging.getLogger(__name__)
+
+# Configurazione via ambiente; LLM_BASE_URL permette di puntare a uno stub locale
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker rejects a call without contacting the upstream"""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast for `reset_seconds`; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD, reset_seconds: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """
+        The trial call ended without an outcome (e.g. cancelled): let the next call be the trial
+        """
+        self._trial_in_flight = False
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent requests, so retries cannot
+    multiply load on an upstream that is already struggling
+    """
+
+    def __init__(self, ratio: float = LLM_RETRY_BUDGET_RATIO, window_seconds: float = 60.0, min_retries: int = 3):
+        self.ratio = ratio
+        self.window_seconds = window_seconds
+        self.min_retries = min_retries
+        self._window_start = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+
+    def _roll(self) -> None:
+        if time.monotonic() - self._window_start >= self.window_seconds:
+            self._window_start = time.monotonic()
+            self.requests = 0
+            self.retries = 0
+
+    def record_request(self) -> None:
+        self._roll()
+        self.requests += 1
+
+    def try_spend(self) -> bool:
+        self._roll()
+        if self.retries < max(self.min_retries, self.requests * self.ratio):
+            self.retries += 1
+            return True
+        return False
+
+class LLMGateway:
+    """
+    Single async entry point for chat completions.
+
+    Shares one pooled HTTP client across the app and layers, in order:
+    content-addressed cache, single-flight coalescing, circuit breaker,
+    per-attempt timeout and jittered exponential retries within a budget.
+    Errors propagate to the caller, which falls back to its static results.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = LLM_BASE_URL,
+        timeout_seconds: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        cache: Optional[LLMCache] = None,
+        singleflight: Optional[SingleFlight] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        meter: Optional[TokenMeter] = None
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.cache = cache if cache is not None else llm_cache
+        self.singleflight = singleflight if singleflight is not None else llm_singleflight
+        self.breaker = breaker or CircuitBreaker()
+        self.retry_budget = retry_budget or RetryBudget()
+        self.meter = meter if meter is not None else token_meter
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout_seconds, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY") or "missing",
+            base_url=base_url,
+            http_client=self._http,
+            max_retries=0  # i retry sono gestiti qui, con budget
+        )
+        self.upstream_calls = 0
+        self.upstream_failures = 0
+        self.retries = 0
+        self.rejected = 0
+
+    async def chat(self, messages: List[Dict], model: str = "gpt-4", call_site: str = "default") -> str:
+        """
+        Return the completion text for `messages`, using the cache when possible.
+        Token usage is recorded per `call_site`.
+        """
+        key = self.cache.make_key(model, messages)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.meter.record(call_site, 0, 0, cached=True)
+            return cached
+
+        async def call_upstream() -> str:
+            started = time.monotonic()
+            content, usage = await self._call_with_retries(messages, model)
+            # Usa i conteggi restituiti dall'API, altrimenti una stima
+            input_tokens = getattr(usage, "prompt_tokens", None) or sum(estimate_tokens(m["content"]) for m in messages)
+            output_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(content)
+            self.meter.record(call_site, input_tokens, output_tokens, time.monotonic() - started)
+            await self.cache.set(key, content, model=model)
+            return content
+
+        # Richieste identiche in volo vengono unite in un'unica chiamata
+        return await self.singleflight.do(key, call_upstream)
+
+    async def chat_json(
+        self,
+        messages: List[Dict],
+        model: str = "gpt-4",
+        call_site: str = "default",
+        schema: Optional[Dict[str, SchemaType]] = None,
+        on_field: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict:
+        """
+        Stream a JSON-object completion and return the validated object.
+
+        `on_field(key, value)` is called for each top-level field as soon as
+        it is complete in the stream. For cache hits and coalesced calls the
+        fields are replayed once the full object is available.
+        """
+        key = self.cache.make_key(model, messages + [{"role": "format", "content": "json_object"}])
+        cached = await self.cache.get(key)
+        if cached is not None:
+            self.meter.record(call_site, 0, 0, cached=True)
+            return self._replay(json.loads(cached), schema, on_field)
+
+        streamed = False
+
+        async def call_upstream() -> str:
+            nonlocal streamed
+            streamed = True
+            started = time.monotonic()
+            content, usage = await self._call_with_retries(
+                messages, model, on_field=on_field, schema=schema, stream_json=True
+            )
+            input_tokens = getattr(usage, "prompt_tokens", None) or sum(estimate_tokens(m["content"]) for m in messages)
+            output_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(content)
+            self.meter.record(call_site, input_tokens, output_tokens, time.monotonic() - started)
+            await self.cache.set(key, content, model=model)
+            return content
+
+        content = await self.singleflight.do(key, call_upstream)
+        result = json.loads(content)
+        if not streamed:
+            return self._replay(result, schema, on_field)
+        return result
+
+    @staticmethod
+    def _replay(result: Dict, schema: Optional[Dict[str, SchemaType]], on_field: Optional[Callable[[str, Any], None]]) -> Dict:
+        if schema:
+            validate_fields(result, schema)
+        if on_field is not None:
+            for field, value in result.items():
+                on_field(field, value)
+        return result
+
+    async def _stream_json(
+        self,
+        messages: List[Dict],
+        model: str,
+        on_field: Optional[Callable[[str, Any], None]],
+        schema: Optional[Dict[str, SchemaType]],
+        emitted: set
+    ) -> Tuple[str, Any]:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parser = IncrementalJSONParser()
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            for field, value in parser.feed(delta):
+                # Dopo un retry non riemettiamo i campi già notificati
+                if on_field is not None and field not in emitted:
+                    emitted.add(field)
+                    on_field(field, value)
+        result = parser.close()
+        if schema:
+            validate_fields(result, schema)
+        return json.dumps(result, ensure_ascii=False), usage
+
+    async def _call_with_retries(
+        self,
+        messages: List[Dict],
+        model: str,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        schema: Optional[Dict[str, SchemaType]] = None,
+        stream_json: bool = False
+    ) -> Tuple[str, Any]:
+        self.retry_budget.record_request()
+        emitted: set = set()
+        attempt = 0
+        while True:
+            trial = self.breaker.state == "half_open"
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError("LLM circuit breaker is open")
+            try:
+                self.upstream_calls += 1
+                if stream_json:
+                    result = await asyncio.wait_for(
+                        self._stream_json(messages, model, on_field, schema, emitted),
+                        timeout=self.timeout_seconds
+                    )
+                    self.breaker.record_success()
+                    return result
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(model=model, messages=messages),
+                    timeout=self.timeout_seconds
+                )
+                self.breaker.record_success()
+                return response.choices[0].message.content, response.usage
+            except RETRYABLE_ERRORS as e:
+                self.upstream_failures += 1
+                self.breaker.record_failure()
+                if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                    raise
+                # Backoff esponenziale con full jitter
+                delay = random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+                logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s")
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+            except ValueError:
+                # Risposta non valida (JSON o schema): il servizio risponde, il breaker non scatta
+                self.breaker.record_success()
+                raise
+            except Exception:
+                # Errori non transitori (es. 400): nessun retry, ma contano per il breaker
+                self.upstream_failures += 1
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # Cancellazione (client disconnesso, singleflight, stream chiuso): nessun esito,
+                # ma la chiamata di prova del half-open va liberata o il circuito resta chiuso a tutti
+                if trial:
+                    self.breaker.release_trial()
+                raise
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "upstream_calls": self.upstream_calls,
+            "upstream_failures": self.upstream_failures,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "tokens": self.meter.stats()
+        }
+
+_gateways: Dict[Optional[str], LLMGateway] = {}
+
+def get_llm_gateway(api_key: Optional[str] = None) -> LLMGateway:
+    """
+    Return the shared gateway for an API key, creating it on first use
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if api_key not in _gateways:
+        _gateways[api_key] = LLMGateway(api_key=api_key)
+    return _gateways[api_key]
+
+async def close_llm_gateways() -> None:
+    for gateway in _gateways.values():
+        await gateway.aclose()
+    _gateways.clear()
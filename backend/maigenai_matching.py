@@ -1,14 +1,71 @@
 from crewai import Agent, Task, Crew, Process
 from textwrap import dedent
-from typing import Dict, List
-import json
-import openai
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
 from datetime import datetime
+from llm_gateway import LLMGateway, get_llm_gateway
+from prompt_builder import build_prompt, compact_json, compact_profile, estimate_tokens, PROMPT_DATA_TOKEN_BUDGET
+from stream_parser import validate_fields
+
+logger = logging.getLogger(__name__)
+
+# Numero massimo di chiamate GPT-4 concorrenti per un batch di matching
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("MATCHING_MAX_CONCURRENCY", "5"))
+
+# Scoring multi-candidato: budget di token per prompt e per singolo profilo riassunto
+MULTI_CANDIDATE_TOKEN_BUDGET = int(os.getenv("MULTI_CANDIDATE_TOKEN_BUDGET", "2500"))
+CANDIDATE_SUMMARY_TOKENS = int(os.getenv("CANDIDATE_SUMMARY_TOKENS", "250"))
+MAX_CANDIDATES_PER_CALL = int(os.getenv("MAX_CANDIDATES_PER_CALL", "10"))
+
+DEFAULT_RECOMMENDATIONS = [
+    "Schedule technical interview",
+    "Review portfolio details",
+    "Discuss project timeline"
+]
+
+# Schemi delle risposte JSON richieste a GPT-4 (stesse chiavi dei risultati di fallback)
+PROFILE_ANALYSIS_SCHEMA = {
+    "technical_scores": dict,
+    "project_relevance": (int, float),
+    "communication_score": (int, float),
+    "red_flags": list,
+    "strengths": list
+}
+PROJECT_ANALYSIS_SCHEMA = {
+    "core_skills": list,
+    "complexity_score": (int, float),
+    "time_estimation": str,
+    "budget_adequacy": str,
+    "challenges": list
+}
+MATCH_RESULT_SCHEMA = {
+    "overall_score": (int, float),
+    "compatibility": dict,
+    "recommendations": list,
+    "risk_factors": list,
+    "success_probability": (int, float)
+}
+CANDIDATE_SCORES_SCHEMA = {
+    "scores": list
+}
+CANDIDATE_SCORE_SCHEMA = {
+    "id": str,
+    "overall_score": (int, float),
+    "recommendations": list
+}
 
 class MaigenAIMatchingSystem:
-    def __init__(self, openai_api_key: str):
+    def __init__(
+        self,
+        openai_api_key: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        gateway: Optional[LLMGateway] = None
+    ):
         self.openai_api_key = openai_api_key
-        openai.api_key = openai_api_key
+        self.max_concurrency = max_concurrency
+        self.gateway = gateway or get_llm_gateway(openai_api_key)
         
     def create_screening_agent(self) -> Agent:
         return Agent(
@@ -35,32 +92,25 @@ class MaigenAIMatchingSystem:
         Analyze a freelancer profile using GPT-4
         """
         try:
-            analysis_prompt = f"""
+            analysis_prompt = build_prompt(f"""
             Analyze this AI/ML freelancer profile in detail:
-            
-            Skills: {profile_data.get('skills', [])}
-            Experience: {profile_data.get('experience', '')}
-            Portfolio: {profile_data.get('portfolio', [])}
-            
-            Provide a structured analysis of:
-            1. Technical expertise level (1-10) in each skill
-            2. Project relevance score (1-10)
-            3. Communication skills assessment
-            4. Red flags or concerns
-            5. Unique strengths
-            """
-            
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert AI freelancer profile analyzer."},
-                    {"role": "user", "content": analysis_prompt}
-                ]
+
+            Profile: {compact_profile(profile_data)}
+
+            Respond with a JSON object with exactly these keys:
+            - "technical_scores": object mapping each skill to an expertise level (1-10)
+            - "project_relevance": number (1-10)
+            - "communication_score": number (1-10)
+            - "red_flags": list of strings
+            - "strengths": list of strings
+            """)
+
+            return await self._json_completion(
+                "You are an expert AI freelancer profile analyzer. Answer in JSON.",
+                analysis_prompt,
+                PROFILE_ANALYSIS_SCHEMA,
+                call_site="matching.analyze_profile"
             )
-            
-            # Parse the response into structured data
-            analysis = self._parse_gpt4_response(response.choices[0].message.content)
-            return analysis
 
         except Exception as e:
             print(f"Error in profile analysis: {str(e)}")
@@ -71,32 +121,31 @@ class MaigenAIMatchingSystem:
         Analyze project requirements using GPT-4
         """
         try:
-            requirements_prompt = f"""
+            project_summary = {
+                "description": project_data.get("description", ""),
+                "required_skills": project_data.get("required_skills", []),
+                "timeline": project_data.get("timeline", ""),
+                "budget": project_data.get("budget", project_data.get("budget_range", ""))
+            }
+            requirements_prompt = build_prompt(f"""
             Analyze these project requirements in detail:
-            
-            Description: {project_data.get('description', '')}
-            Required Skills: {project_data.get('required_skills', [])}
-            Timeline: {project_data.get('timeline', '')}
-            Budget: {project_data.get('budget', '')}
-            
-            Provide a structured analysis of:
-            1. Core skills needed
-            2. Project complexity (1-10)
-            3. Time estimation accuracy
-            4. Budget adequacy
-            5. Potential challenges
-            """
-            
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert project requirements analyzer."},
-                    {"role": "user", "content": requirements_prompt}
-                ]
+
+            Project: {compact_json(project_summary, max_tokens=PROMPT_DATA_TOKEN_BUDGET)}
+
+            Respond with a JSON object with exactly these keys:
+            - "core_skills": list of strings
+            - "complexity_score": number (1-10)
+            - "time_estimation": string, how realistic the timeline is
+            - "budget_adequacy": string, how adequate the budget is
+            - "challenges": list of strings
+            """)
+
+            return await self._json_completion(
+                "You are an expert project requirements analyzer. Answer in JSON.",
+                requirements_prompt,
+                PROJECT_ANALYSIS_SCHEMA,
+                call_site="matching.analyze_project"
             )
-            
-            analysis = self._parse_gpt4_response(response.choices[0].message.content)
-            return analysis
 
         except Exception as e:
             print(f"Error in project analysis: {str(e)}")
@@ -106,76 +155,268 @@ class MaigenAIMatchingSystem:
         """
         Execute the matching process using GPT-4
         """
+        # Profile and project analyses are independent, run them in parallel
+        profile_analysis, project_analysis = await asyncio.gather(
+            self.analyze_profile(freelancer_profile),
+            self.analyze_project_requirements(project)
+        )
+        return await self.score_match(profile_analysis, project_analysis)
+
+    async def execute_batch_matching(
+        self,
+        freelancer_profiles: List[Dict],
+        project: Dict,
+        max_concurrency: Optional[int] = None,
+        multi_candidate: bool = False
+    ) -> List[Dict]:
+        """
+        Match many freelancers against one project, returning results in the input order
+        """
+        results: List[Optional[Dict]] = [None] * len(freelancer_profiles)
+        async for index, match_result in self.iter_batch_matching(
+            freelancer_profiles, project, max_concurrency, multi_candidate=multi_candidate
+        ):
+            results[index] = match_result
+        return results
+
+    async def iter_batch_matching(
+        self,
+        freelancer_profiles: List[Dict],
+        project: Dict,
+        max_concurrency: Optional[int] = None,
+        on_score: Optional[Callable[[int, float], None]] = None,
+        multi_candidate: bool = False
+    ) -> AsyncIterator[Tuple[int, Dict]]:
+        """
+        Match many freelancers against one project, yielding (index, result)
+        pairs as soon as each pair is scored.
+
+        The project is analyzed once per batch, concurrently with the profile
+        analyses, and at most `max_concurrency` GPT-4 calls are in flight at
+        any time. Pending calls are cancelled if the consumer stops iterating
+        early. `on_score(index, score)` is called as soon as a pair's overall
+        score is streamed, before its full result is yielded.
+
+        With `multi_candidate`, compact profile summaries are scored several
+        at a time with score_candidates instead of one analysis and one
+        scoring call per freelancer; a chunk whose response cannot be parsed
+        falls back to per-pair scoring.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        project_task = asyncio.ensure_future(self.analyze_project_requirements(project))
+
+        # Indici il cui punteggio è già stato notificato: on_score al massimo una volta per coppia
+        notified = set()
+
+        def report(index: int, score: float) -> None:
+            if index not in notified:
+                notified.add(index)
+                on_score(index, score)
+
+        def notify(index: int) -> Optional[Callable[[float], None]]:
+            # Nel fallback per coppia non si rinotifica chi è già stato annunciato dal blocco
+            return (lambda score: report(index, score)) if on_score and index not in notified else None
+
+        async def match_one(index: int, freelancer_profile: Dict) -> List[Tuple[int, Dict]]:
+            async with semaphore:
+                profile_analysis = await self.analyze_profile(freelancer_profile)
+            project_analysis = await asyncio.shield(project_task)
+            async with semaphore:
+                return [(index, await self.score_match(profile_analysis, project_analysis, on_score=notify(index)))]
+
+        async def match_chunk(indexes: List[int]) -> List[Tuple[int, Dict]]:
+            project_analysis = await asyncio.shield(project_task)
+            try:
+                async with semaphore:
+                    results = await self.score_candidates(
+                        project_analysis,
+                        [freelancer_profiles[i] for i in indexes],
+                        on_score=(lambda position, score: report(indexes[position], score)) if on_score else None
+                    )
+                return list(zip(indexes, results))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Error in multi-candidate scoring, falling back to per-pair: {str(e)}")
+                pairs = await asyncio.gather(*(match_one(i, freelancer_profiles[i]) for i in indexes))
+                return [pair for pair_list in pairs for pair in pair_list]
+
+        if multi_candidate:
+            tasks = [
+                asyncio.ensure_future(match_chunk(chunk))
+                for chunk in self._chunk_candidates(freelancer_profiles)
+            ]
+        else:
+            tasks = [asyncio.ensure_future(match_one(i, f)) for i, f in enumerate(freelancer_profiles)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for pair in await next_done:
+                    yield pair
+        finally:
+            for task in tasks + [project_task]:
+                if not task.done():
+                    task.cancel()
+
+    def _chunk_candidates(self, freelancer_profiles: List[Dict]) -> List[List[int]]:
+        """
+        Group candidate indexes so each multi-candidate prompt stays within
+        MULTI_CANDIDATE_TOKEN_BUDGET and MAX_CANDIDATES_PER_CALL
+        """
+        chunks: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for index, profile in enumerate(freelancer_profiles):
+            tokens = estimate_tokens(compact_profile(profile, max_tokens=CANDIDATE_SUMMARY_TOKENS))
+            if current and (
+                current_tokens + tokens > MULTI_CANDIDATE_TOKEN_BUDGET or len(current) >= MAX_CANDIDATES_PER_CALL
+            ):
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def score_candidates(
+        self,
+        project_analysis: Dict,
+        freelancer_profiles: List[Dict],
+        on_score: Optional[Callable[[int, float], None]] = None
+    ) -> List[Dict]:
+        """
+        Score several freelancers against one analyzed project in a single
+        GPT-4 call. Results are returned in the input order; raises
+        ValueError unless every candidate gets a valid score.
+        """
+        candidate_ids = [f"c{i}" for i in range(len(freelancer_profiles))]
+        # Oggetto JSON su una sola riga, indicizzato per id del candidato
+        candidates = "{" + ", ".join(
+            f'"{candidate_id}": {compact_profile(profile, max_tokens=CANDIDATE_SUMMARY_TOKENS)}'
+            for candidate_id, profile in zip(candidate_ids, freelancer_profiles)
+        ) + "}"
+        scoring_prompt = build_prompt(f"""
+        Score how well each of these freelancers fits the project.
+
+        Project Analysis:
+        {compact_json(project_analysis, max_tokens=PROMPT_DATA_TOKEN_BUDGET)}
+
+        Candidates (profiles keyed by candidate id):
+        {candidates}
+
+        Respond with a JSON object with a single key "scores": a list with one
+        object per candidate, each with exactly these keys:
+        - "id": the candidate id (e.g. "c0")
+        - "overall_score": number (0-10)
+        - "compatibility": object with a short assessment per area (skills, experience, budget)
+        - "recommendations": list of strings
+        """)
+
+        def forward_scores(field: str, value: Any) -> None:
+            if on_score is None or field != "scores" or not isinstance(value, list):
+                return
+            for item in value:
+                if isinstance(item, dict) and item.get("id") in candidate_ids and isinstance(item.get("overall_score"), (int, float)):
+                    on_score(candidate_ids.index(item["id"]), min(max(float(item["overall_score"]), 0.0), 10.0))
+
+        response = await self._json_completion(
+            "You are an expert AI freelancer-project matcher. Answer in JSON.",
+            scoring_prompt,
+            CANDIDATE_SCORES_SCHEMA,
+            call_site="matching.score_candidates",
+            on_field=forward_scores
+        )
+
+        by_id = {}
+        for item in response["scores"]:
+            if not isinstance(item, dict):
+                raise ValueError("Invalid candidate score entry")
+            validate_fields(item, CANDIDATE_SCORE_SCHEMA)
+            by_id[item["id"]] = item
+        missing = set(candidate_ids) - set(by_id)
+        if missing:
+            raise ValueError(f"Missing scores for candidates {sorted(missing)}")
+
+        return [
+            {
+                "match_score": min(max(float(by_id[candidate_id]["overall_score"]), 0.0), 10.0),
+                "fallback": False,
+                "analysis": {k: v for k, v in by_id[candidate_id].items() if k != "id"},
+                "recommendations": by_id[candidate_id]["recommendations"] or DEFAULT_RECOMMENDATIONS
+            }
+            for candidate_id in candidate_ids
+        ]
+
+    async def score_match(
+        self,
+        profile_analysis: Dict,
+        project_analysis: Dict,
+        on_score: Optional[Callable[[float], None]] = None
+    ) -> Dict:
+        """
+        Score the compatibility between an analyzed profile and an analyzed project.
+        `on_score` receives the overall score as soon as it is streamed.
+        """
         try:
-            # Analyze both profile and project
-            profile_analysis = await self.analyze_profile(freelancer_profile)
-            project_analysis = await self.analyze_project_requirements(project)
-            
             # Create matching prompt
-            matching_prompt = f"""
+            matching_prompt = build_prompt(f"""
             Analyze the compatibility between this freelancer and project:
 
             Freelancer Analysis:
-            {json.dumps(profile_analysis, indent=2)}
+            {compact_json(profile_analysis, max_tokens=PROMPT_DATA_TOKEN_BUDGET)}
 
             Project Analysis:
-            {json.dumps(project_analysis, indent=2)}
-
-            Provide:
-            1. Overall match score (0-10)
-            2. Compatibility breakdown
-            3. Specific recommendations
-            4. Risk factors
-            5. Success probability
-            """
-
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert AI freelancer-project matcher."},
-                    {"role": "user", "content": matching_prompt}
-                ]
+            {compact_json(project_analysis, max_tokens=PROMPT_DATA_TOKEN_BUDGET)}
+
+            Respond with a JSON object with exactly these keys, in this order:
+            - "overall_score": number (0-10)
+            - "compatibility": object with a short assessment per area (skills, experience, budget, timeline)
+            - "recommendations": list of strings
+            - "risk_factors": list of strings
+            - "success_probability": number (0-1)
+            """)
+
+            def forward_score(field: str, value: Any) -> None:
+                # Il punteggio arriva per primo: lo notifichiamo prima che l'analisi sia completa
+                if on_score is not None and field == "overall_score" and isinstance(value, (int, float)):
+                    on_score(min(max(float(value), 0.0), 10.0))
+
+            match_result = await self._json_completion(
+                "You are an expert AI freelancer-project matcher. Answer in JSON.",
+                matching_prompt,
+                MATCH_RESULT_SCHEMA,
+                call_site="matching.score_match",
+                on_field=forward_score
             )
 
-            match_result = self._parse_gpt4_response(response.choices[0].message.content)
-            
             return {
-                "match_score": match_result.get("overall_score", 7.5),
+                "match_score": min(max(float(match_result["overall_score"]), 0.0), 10.0),
+                "fallback": False,
                 "analysis": match_result,
-                "recommendations": match_result.get("recommendations", [
-                    "Schedule technical interview",
-                    "Review portfolio details",
-                    "Discuss project timeline"
-                ])
+                "recommendations": match_result["recommendations"] or DEFAULT_RECOMMENDATIONS
             }
 
         except Exception as e:
             print(f"Error in matching execution: {str(e)}")
             return self._get_fallback_match_result()
 
-    def _parse_gpt4_response(self, response: str) -> Dict:
+    async def _json_completion(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema: Dict,
+        call_site: str = "matching",
+        on_field: Optional[Callable[[str, Any], None]] = None,
+        model: str = "gpt-4"
+    ) -> Dict:
         """
-        Parse GPT-4 response into structured data
+        Call GPT-4 through the shared LLM gateway with streamed JSON output,
+        validated against `schema`
         """
-        try:
-            # Basic parsing - in production you'd want more robust parsing
-            sections = response.split('\n\n')
-            parsed_response = {}
-            
-            current_section = None
-            for section in sections:
-                if ':' in section:
-                    title, content = section.split(':', 1)
-                    current_section = title.strip()
-                    parsed_response[current_section] = []
-                    items = content.strip().split('\n- ')
-                    parsed_response[current_section].extend([item.strip() for item in items if item])
-
-            return parsed_response
-
-        except Exception as e:
-            print(f"Error parsing GPT-4 response: {str(e)}")
-            return {}
+        return await self.gateway.chat_json([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ], model=model, call_site=call_site, schema=schema, on_field=on_field)
 
     def _get_fallback_analysis(self) -> Dict:
         """
@@ -211,6 +452,7 @@ class MaigenAIMatchingSystem:
         """
         return {
             "match_score": 7.5,
+            "fallback": True,
             "analysis": {
                 "skill_match": "Good",
                 "experience_match": "Adequate",
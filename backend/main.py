@@ -1,13 +1,21 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from maigenai_matching import MaigenAIMatchingSystem
-from ai_advisor import AIAdvisor
 import os
 from dotenv import load_dotenv
-from routers import profiles, companies, projects, matching, suggestions, auth
 
+# Carica .env prima dei router: il gateway LLM legge la configurazione all'import
 load_dotenv()
 
+from routers import profiles, companies, projects, matching, suggestions, auth, bulk
+from skill_index import skill_index, project_skill_index
+from vector_index import rebuild_vector_indexes
+from prescoring import prescorer
+from llm_gateway import close_llm_gateways
+from database import async_engine
+from migrations import run_migrations
+from password_hashing import password_hasher
+from pagination import NEXT_CURSOR_HEADER, NEXT_OFFSET_HEADER
+
 app = FastAPI()
 
 app.add_middleware(
@@ -16,10 +24,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permetti tutti i metodi
     allow_headers=["*"],  # Permetti tutti gli header
+    expose_headers=[NEXT_CURSOR_HEADER, NEXT_OFFSET_HEADER, "ETag"],  # Paginazione e ETag leggibili dal frontend
 )
 
-matching_system = MaigenAIMatchingSystem(openai_api_key=os.getenv("OPENAI_API_KEY"))
-advisor = AIAdvisor(openai_api_key=os.getenv("OPENAI_API_KEY"))
+# Istanze condivise con i router: un solo gateway LLM per tutta l'app
+matching_system = matching.matching_system
+advisor = suggestions.advisor
 
 # Includi tutti i router
 app.include_router(auth.router)
@@ -28,6 +38,25 @@ app.include_router(companies.router)
 app.include_router(projects.router)
 app.include_router(matching.router)
 app.include_router(suggestions.router)
+app.include_router(bulk.router)
+
+@app.on_event("startup")
+async def on_startup():
+    run_migrations()
+    skill_index.rebuild()
+    project_skill_index.rebuild()
+    rebuild_vector_indexes()
+    prescorer.rebuild()
+    await matching.match_jobs.start()
+    await matching.match_materializer.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await matching.match_jobs.stop()
+    await matching.match_materializer.stop()
+    await close_llm_gateways()
+    await async_engine.dispose()
+    password_hasher.shutdown()
 
 @app.get("/")
 async def root():
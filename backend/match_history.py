@@ -0,0 +1,146 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import os
+import time
+from database import SessionLocal, MatchHistoryModel, FreelancerMatchStatsModel
+from skill_index import normalize_skill
+
+# Punteggio minimo perché un match conti come "riuscito"
+MATCH_SUCCESS_SCORE = float(os.getenv("MATCH_SUCCESS_SCORE", "7.0"))
+RECENT_MATCHES_LIMIT = int(os.getenv("RECENT_MATCHES_LIMIT", "5"))
+TOP_SKILLS_LIMIT = 3
+
+def matched_skills(freelancer_skills: Iterable[str], required_skills: Iterable[str]) -> List[str]:
+    """
+    Required skills of the project that the freelancer has, normalized
+    """
+    have = {normalize_skill(skill) for skill in freelancer_skills or []}
+    return sorted({normalize_skill(skill) for skill in required_skills or []} & have)
+
+class MatchHistory:
+    """
+    Append-only history of produced matches plus per-freelancer rollups.
+
+    Rollups in `freelancer_match_stats` are updated in the same transaction
+    as the history insert, so reading stats is a primary-key lookup no
+    matter how many history rows a freelancer has.
+    """
+
+    def record(
+        self,
+        matches: List[Dict],
+        source: str,
+        project_title: Optional[str] = None,
+        project_id: Optional[int] = None
+    ) -> None:
+        """
+        Persist matches ({"freelancer_id", "match_score", "matched_skills"})
+        and fold them into the freelancers' rollups
+        """
+        if not matches:
+            return
+        now = time.time()
+        by_freelancer: Dict[int, List[Dict]] = defaultdict(list)
+        for match in matches:
+            by_freelancer[int(match["freelancer_id"])].append(match)
+
+        db = SessionLocal()
+        try:
+            db.add_all([
+                MatchHistoryModel(
+                    freelancer_id=int(match["freelancer_id"]),
+                    project_id=project_id,
+                    project_title=project_title,
+                    source=source,
+                    match_score=match["match_score"],
+                    matched_skills=match.get("matched_skills") or [],
+                    created_at=now
+                )
+                for match in matches
+            ])
+            rollups = {
+                stats.freelancer_id: stats
+                for stats in db.query(FreelancerMatchStatsModel).filter(
+                    FreelancerMatchStatsModel.freelancer_id.in_(list(by_freelancer))
+                ).all()
+            }
+            for freelancer_id, freelancer_matches in by_freelancer.items():
+                stats = rollups.get(freelancer_id)
+                if stats is None:
+                    stats = FreelancerMatchStatsModel(
+                        freelancer_id=freelancer_id,
+                        total_matches=0,
+                        successful_matches=0,
+                        score_sum=0.0,
+                        skill_counts={},
+                        recent_matches=[]
+                    )
+                    db.add(stats)
+                self._fold(stats, freelancer_matches, project_id, project_title, now)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _fold(
+        self,
+        stats: FreelancerMatchStatsModel,
+        matches: List[Dict],
+        project_id: Optional[int],
+        project_title: Optional[str],
+        now: float
+    ) -> None:
+        skill_counts = dict(stats.skill_counts or {})
+        for match in matches:
+            for skill in match.get("matched_skills") or []:
+                skill_counts[skill] = skill_counts.get(skill, 0) + 1
+        recent = [
+            {
+                "project_id": str(project_id) if project_id is not None else None,
+                "project_title": project_title,
+                "match_score": match["match_score"],
+                "date": datetime.fromtimestamp(now).isoformat()
+            }
+            for match in matches
+        ]
+
+        stats.total_matches = (stats.total_matches or 0) + len(matches)
+        stats.successful_matches = (stats.successful_matches or 0) + sum(
+            1 for match in matches if match["match_score"] >= MATCH_SUCCESS_SCORE
+        )
+        stats.score_sum = (stats.score_sum or 0.0) + sum(match["match_score"] for match in matches)
+        # I campi JSON vanno riassegnati perché SQLAlchemy rilevi la modifica
+        stats.skill_counts = skill_counts
+        stats.recent_matches = (recent + list(stats.recent_matches or []))[:RECENT_MATCHES_LIMIT]
+        stats.updated_at = now
+
+    def get_stats(self, freelancer_id: int) -> Dict:
+        db = SessionLocal()
+        try:
+            stats = db.query(FreelancerMatchStatsModel).filter(
+                FreelancerMatchStatsModel.freelancer_id == freelancer_id
+            ).first()
+        finally:
+            db.close()
+
+        if stats is None:
+            return {
+                "total_matches": 0,
+                "successful_matches": 0,
+                "average_score": 0.0,
+                "top_matching_skills": [],
+                "recent_matches": []
+            }
+        skill_counts = stats.skill_counts or {}
+        return {
+            "total_matches": stats.total_matches,
+            "successful_matches": stats.successful_matches,
+            "average_score": round(stats.score_sum / stats.total_matches, 2) if stats.total_matches else 0.0,
+            "top_matching_skills": sorted(skill_counts, key=lambda skill: (-skill_counts[skill], skill))[:TOP_SKILLS_LIMIT],
+            "recent_matches": stats.recent_matches or []
+        }
+
+match_history = MatchHistory()
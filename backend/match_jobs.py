@@ -0,0 +1,245 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+import uuid
+from database import SessionLocal, MatchJobModel, MatchJobItemModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("MATCH_JOB_WORKERS", "2"))
+# Risultati scritti per transazione: dopo un riavvio se ne ricalcolano al massimo tanti
+RESULT_BATCH_SIZE = int(os.getenv("MATCH_JOB_RESULT_BATCH_SIZE", "20"))
+
+class MatchJobQueue:
+    """
+    Background queue for large matching runs.
+
+    Each job is one project matched against a list of prescored candidates.
+    Jobs and per-candidate results are persisted in `match_jobs` and
+    `match_job_items`, so a restart re-enqueues unfinished jobs and only the
+    pending candidates are scored again. Database work runs in worker
+    threads, and results are written in batches of RESULT_BATCH_SIZE.
+    """
+
+    def __init__(
+        self,
+        matching_system,
+        load_profiles: Callable[[List[int]], List[Dict]],
+        build_match: Callable[[Dict, Dict, Dict], Dict],
+        workers: int = DEFAULT_WORKERS
+    ):
+        self.matching_system = matching_system
+        self.load_profiles = load_profiles
+        self.build_match = build_match
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Start the worker pool and resume jobs left unfinished by a previous run
+        """
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+        for job_id in await asyncio.to_thread(self._unfinished_jobs):
+            logger.info(f"Resuming match job {job_id}")
+            self._queue.put_nowait(job_id)
+
+    def _unfinished_jobs(self) -> List[str]:
+        db = SessionLocal()
+        try:
+            return [
+                job_id
+                for (job_id,) in db.query(MatchJobModel.id).filter(
+                    MatchJobModel.status.in_(["queued", "running"])
+                ).order_by(MatchJobModel.created_at).all()
+            ]
+        finally:
+            db.close()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, project: Dict, prescored: List[Dict], min_score: float = 0.0) -> str:
+        """
+        Persist a new job with one pending item per prescored candidate and enqueue it
+        """
+        # Prima del commit: un job salvato senza coda resterebbe "queued" per sempre
+        if self._queue is None:
+            raise RuntimeError("Match job queue not started")
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._persist_job, job_id, project, prescored, min_score)
+        # asyncio.Queue non è thread-safe: si accoda dal loop, dopo il commit
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def _persist_job(self, job_id: str, project: Dict, prescored: List[Dict], min_score: float) -> None:
+        now = time.time()
+        db = SessionLocal()
+        try:
+            db.add(MatchJobModel(
+                id=job_id,
+                status="queued",
+                project=project,
+                min_score=min_score,
+                total=len(prescored),
+                completed=0,
+                created_at=now,
+                updated_at=now
+            ))
+            db.add_all([
+                MatchJobItemModel(job_id=job_id, freelancer_id=p["freelancer_id"], status="pending", prescore=p)
+                for p in prescored
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._load_job, job_id)
+
+    def _load_job(self, job_id: str) -> Optional[Dict]:
+        db = SessionLocal()
+        try:
+            job = db.query(MatchJobModel).filter(MatchJobModel.id == job_id).first()
+            if job is None:
+                return None
+            return {
+                "job_id": job.id,
+                "status": job.status,
+                "total": job.total,
+                "completed": job.completed,
+                "progress": round(job.completed / job.total, 4) if job.total else 1.0,
+                "error": job.error,
+                "created_at": job.created_at,
+                "updated_at": job.updated_at
+            }
+        finally:
+            db.close()
+
+    async def get_results(self, job_id: str, offset: int = 0, limit: int = 50) -> List[Dict]:
+        """
+        Return completed matches above the job's min_score, best first
+        """
+        return await asyncio.to_thread(self._load_results, job_id, offset, limit)
+
+    def _load_results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            job = db.query(MatchJobModel).filter(MatchJobModel.id == job_id).first()
+            if job is None:
+                return []
+            items = db.query(MatchJobItemModel).filter(
+                MatchJobItemModel.job_id == job_id,
+                MatchJobItemModel.status == "done",
+                MatchJobItemModel.match_score >= job.min_score
+            ).order_by(
+                MatchJobItemModel.match_score.desc(), MatchJobItemModel.id
+            ).offset(offset).limit(limit).all()
+            return [item.result for item in items]
+        finally:
+            db.close()
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Match job {job_id} failed: {str(e)}")
+                await asyncio.to_thread(self._update_job, job_id, status="failed", error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str) -> None:
+        loaded = await asyncio.to_thread(self._load_pending, job_id)
+        if loaded is None:
+            return
+        project, pending = loaded
+
+        prescores = {freelancer_id: prescore for freelancer_id, prescore in pending}
+        freelancers = await asyncio.to_thread(self.load_profiles, list(prescores))
+
+        results: List[Tuple[int, Optional[Dict]]] = []
+        async for index, match_result in self.matching_system.iter_batch_matching(
+            freelancers, project, multi_candidate=True
+        ):
+            freelancer = freelancers[index]
+            freelancer_id = int(freelancer["id"])
+            results.append((freelancer_id, self.build_match(freelancer, match_result, prescores[freelancer_id])))
+            if len(results) >= RESULT_BATCH_SIZE:
+                await asyncio.to_thread(self._store_results, job_id, results)
+                results = []
+
+        # I candidati cancellati dal database nel frattempo non verranno mai completati
+        missing = set(prescores) - {int(f["id"]) for f in freelancers}
+        results.extend((freelancer_id, None) for freelancer_id in missing)
+        await asyncio.to_thread(self._store_results, job_id, results, "completed")
+
+    def _load_pending(self, job_id: str) -> Optional[Tuple[Dict, List]]:
+        """
+        Mark the job running and return its project and pending (freelancer_id, prescore) items
+        """
+        db = SessionLocal()
+        try:
+            job = db.query(MatchJobModel).filter(MatchJobModel.id == job_id).first()
+            if job is None or job.status in ("completed", "failed"):
+                return None
+            pending = db.query(MatchJobItemModel.freelancer_id, MatchJobItemModel.prescore).filter(
+                MatchJobItemModel.job_id == job_id,
+                MatchJobItemModel.status == "pending"
+            ).all()
+            project = job.project
+            job.status = "running"
+            job.updated_at = time.time()
+            db.commit()
+            return project, pending
+        finally:
+            db.close()
+
+    def _store_results(self, job_id: str, results: List[Tuple[int, Optional[Dict]]], status: Optional[str] = None) -> None:
+        """
+        Store a batch of (freelancer_id, match) results in one transaction,
+        optionally setting the job status in the same commit
+        """
+        db = SessionLocal()
+        try:
+            for freelancer_id, match in results:
+                db.query(MatchJobItemModel).filter(
+                    MatchJobItemModel.job_id == job_id,
+                    MatchJobItemModel.freelancer_id == freelancer_id
+                ).update({
+                    "status": "done",
+                    "match_score": match["match_score"] if match else None,
+                    "result": match
+                }, synchronize_session=False)
+            values = {"completed": MatchJobModel.completed + len(results), "updated_at": time.time()}
+            if status is not None:
+                values["status"] = status
+            db.query(MatchJobModel).filter(MatchJobModel.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _update_job(self, job_id: str, **values) -> None:
+        db = SessionLocal()
+        try:
+            values["updated_at"] = time.time()
+            db.query(MatchJobModel).filter(MatchJobModel.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,310 @@
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import func
+from database import SessionLocal, MatchModel, ProjectMatchStateModel, ProjectModel
+from prescoring import prescorer
+from skill_index import project_skill_index
+from vector_index import freelancer_index, project_index, freelancer_text
+
+logger = logging.getLogger(__name__)
+
+MATCHES_TOP_K = int(os.getenv("MATCHES_TOP_K", "10"))
+# Attesa prima di ricalcolare, per raggruppare modifiche ravvicinate
+REFRESH_DEBOUNCE_SECONDS = float(os.getenv("MATCHES_REFRESH_DEBOUNCE_SECONDS", "2"))
+# Progetti candidati quando cambia un freelancer: i più vicini per skill e per semantica
+AFFECTED_SKILL_CANDIDATES = 500
+AFFECTED_SEMANTIC_NEIGHBOURS = 50
+# Ogni progetto dirty costa un rerank GPT-4: limite per singola modifica (o blocco di import)
+MAX_DIRTY_PER_CHANGE = int(os.getenv("MATCHES_MAX_DIRTY_PER_CHANGE", "100"))
+
+class MatchMaterializer:
+    """
+    Maintains the `matches` table: the current top-K freelancers per project.
+
+    Writes only mark the affected projects dirty in `project_match_state`;
+    a background task rescores dirty projects with the same prescore + GPT-4
+    rerank pipeline used by batch_match. A project is marked clean only if
+    no new change arrived while it was being rescored.
+    """
+
+    def __init__(
+        self,
+        matching_system,
+        load_profiles: Callable[[List[int]], List[Dict]],
+        build_match: Callable[[Dict, Dict, Dict], Dict],
+        top_k: int = MATCHES_TOP_K
+    ):
+        self.matching_system = matching_system
+        self.load_profiles = load_profiles
+        self.build_match = build_match
+        self.top_k = top_k
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()  # processa i progetti rimasti dirty dal run precedente
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def mark_projects_dirty(self, project_ids: Iterable[int]) -> None:
+        project_ids = set(project_ids)
+        if not project_ids:
+            return
+        await asyncio.to_thread(self._store_dirty, project_ids)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _store_dirty(self, project_ids: Set[int]) -> None:
+        now = time.time()
+        db = SessionLocal()
+        try:
+            states = {
+                state.project_id: state
+                for state in db.query(ProjectMatchStateModel).filter(
+                    ProjectMatchStateModel.project_id.in_(project_ids)
+                ).all()
+            }
+            for project_id in project_ids:
+                state = states.get(project_id)
+                if state is None:
+                    db.add(ProjectMatchStateModel(project_id=project_id, dirty=True, dirty_version=1, dirty_since=now))
+                else:
+                    if not state.dirty:
+                        state.dirty_since = now
+                    state.dirty = True
+                    state.dirty_version = (state.dirty_version or 0) + 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def mark_freelancer_dirty(self, freelancer_id: int, skills: List[str], experience: str, portfolio: List) -> None:
+        """
+        Mark dirty the projects whose stored top-K a freelancer change can
+        alter; see mark_freelancers_dirty
+        """
+        await self.mark_freelancers_dirty([(freelancer_id, skills, experience, portfolio)])
+
+    async def mark_freelancers_dirty(self, freelancers: List[Tuple[int, List[str], str, List]]) -> None:
+        """
+        For (id, skills, experience, portfolio) changes, e.g. a bulk import
+        chunk. The top-K is chosen by prescore, so a project needs a refresh
+        only if a changed freelancer is in its stored top-K (it may leave it
+        or its entry is outdated) or would now enter it: new prescore above
+        the stored K-th, or top-K not full. Candidates are the projects
+        closest by skills and semantics; at most MAX_DIRTY_PER_CHANGE
+        projects are marked, those ranking the freelancer first, then by margin.
+        """
+        if not freelancers:
+            return
+        candidates: Dict[int, Set[int]] = {}
+        for freelancer_id, skills, experience, portfolio in freelancers:
+            neighbours = project_skill_index.shortlist(skills or [], limit=AFFECTED_SKILL_CANDIDATES)
+            vector = freelancer_index.vector_for(freelancer_id)
+            if vector is None:
+                vector = project_index.embedder.embed([freelancer_text(skills, experience, portfolio)])[0]
+            neighbours += [
+                (project_id, similarity)
+                for project_id, similarity in project_index.search_vector(vector, k=AFFECTED_SEMANTIC_NEIGHBOURS)
+                if similarity > 0
+            ]
+            for project_id, _ in neighbours:
+                candidates.setdefault(project_id, set()).add(freelancer_id)
+
+        freelancer_ids = [freelancer[0] for freelancer in freelancers]
+        ranking, stored, projects = await asyncio.to_thread(self._load_affected, freelancer_ids, set(candidates))
+
+        margins: Dict[int, float] = {project_id: float("inf") for project_id in ranking}
+        for row in projects:
+            project = {
+                "title": row.title,
+                "description": row.description,
+                "required_skills": row.required_skills or [],
+                "budget": row.budget,
+                "timeline": row.timeline
+            }
+            prescores = prescorer.prescore_for(project, candidates[row.id], project_index.vector_for(row.id))
+            if not prescores:
+                continue
+            best = max(prescores.values())
+            count, kth_prescore = stored.get(row.id, (0, None))
+            if count < self.top_k:
+                margins[row.id] = best
+            elif best > (kth_prescore or 0.0):
+                margins[row.id] = best - kth_prescore
+
+        affected = sorted(margins, key=lambda project_id: -margins[project_id])
+        if len(affected) > MAX_DIRTY_PER_CHANGE:
+            logger.info(f"{len(affected)} projects affected by {len(freelancers)} freelancer changes, refreshing {MAX_DIRTY_PER_CHANGE}")
+        await self.mark_projects_dirty(affected[:MAX_DIRTY_PER_CHANGE])
+
+    def _load_affected(self, freelancer_ids: List[int], candidate_ids: Set[int]) -> Tuple[Set[int], Dict, List]:
+        """
+        Projects ranking any of the freelancers, and the stored top-K size,
+        K-th prescore and attributes of the computed candidate projects
+        """
+        db = SessionLocal()
+        try:
+            ranking = {
+                project_id
+                for (project_id,) in db.query(MatchModel.project_id).filter(
+                    MatchModel.freelancer_id.in_(freelancer_ids)
+                ).distinct().all()
+            }
+            # I progetti mai calcolati vengono calcolati alla prima lettura
+            unranked = candidate_ids - ranking
+            computed = {
+                project_id
+                for (project_id,) in db.query(ProjectMatchStateModel.project_id).filter(
+                    ProjectMatchStateModel.project_id.in_(unranked)
+                ).all()
+            }
+            stored = {
+                project_id: (count, kth_prescore)
+                for project_id, count, kth_prescore in db.query(
+                    MatchModel.project_id, func.count(), func.min(MatchModel.prescore)
+                ).filter(MatchModel.project_id.in_(computed)).group_by(MatchModel.project_id).all()
+            }
+            projects = db.query(
+                ProjectModel.id, ProjectModel.title, ProjectModel.description,
+                ProjectModel.required_skills, ProjectModel.budget, ProjectModel.timeline
+            ).filter(ProjectModel.id.in_(computed)).all()
+            return ranking, stored, projects
+        finally:
+            db.close()
+
+    async def get_top_matches(self, project_id: int) -> Dict:
+        """
+        Indexed read of the materialized top-K for a project, with staleness info
+        """
+        state, matches = await asyncio.to_thread(self._load_top, project_id)
+        if state is None:
+            # Mai calcolato: lo mettiamo in coda per il prossimo refresh
+            await self.mark_projects_dirty([project_id])
+        return {
+            "project_id": project_id,
+            "stale": state is None or bool(state["dirty"]),
+            "dirty_since": state["dirty_since"] if state else None,
+            "computed_at": state["refreshed_at"] if state else None,
+            "matches": matches
+        }
+
+    def _load_top(self, project_id: int) -> Tuple[Optional[Dict], List[Dict]]:
+        db = SessionLocal()
+        try:
+            state = db.query(
+                ProjectMatchStateModel.dirty, ProjectMatchStateModel.dirty_since, ProjectMatchStateModel.refreshed_at
+            ).filter(ProjectMatchStateModel.project_id == project_id).first()
+            rows = db.query(MatchModel.result).filter(MatchModel.project_id == project_id).order_by(MatchModel.rank).all()
+            return (None if state is None else state._asdict()), [row.result for row in rows]
+        finally:
+            db.close()
+
+    async def refresh_project(self, project_id: int) -> None:
+        seen_version, project = await asyncio.to_thread(self._load_project, project_id)
+
+        matches: List[Dict] = []
+        if project is not None:
+            prescored = prescorer.score(project, k=self.top_k)
+            prescores = {p["freelancer_id"]: p for p in prescored}
+            freelancers = await asyncio.to_thread(self.load_profiles, list(prescores))
+            results = await self.matching_system.execute_batch_matching(
+                freelancers, project, multi_candidate=True
+            )
+            matches = [
+                self.build_match(freelancer, result, prescores[int(freelancer["id"])])
+                for freelancer, result in zip(freelancers, results)
+            ]
+            matches.sort(key=lambda m: (m["match_score"], m["prescore"]), reverse=True)
+
+        await asyncio.to_thread(self._store_matches, project_id, seen_version, matches)
+
+    def _load_project(self, project_id: int) -> Tuple[int, Optional[Dict]]:
+        """
+        The project's dirty_version seen before rescoring, and its attributes (None if deleted)
+        """
+        db = SessionLocal()
+        try:
+            state = db.query(ProjectMatchStateModel).filter(ProjectMatchStateModel.project_id == project_id).first()
+            seen_version = state.dirty_version if state else 0
+            project_row = db.query(ProjectModel).filter(ProjectModel.id == project_id).first()
+            project = None if project_row is None else {
+                "title": project_row.title,
+                "description": project_row.description,
+                "required_skills": project_row.required_skills or [],
+                "budget": project_row.budget,
+                "timeline": project_row.timeline
+            }
+            return seen_version, project
+        finally:
+            db.close()
+
+    def _store_matches(self, project_id: int, seen_version: int, matches: List[Dict]) -> None:
+        now = time.time()
+        db = SessionLocal()
+        try:
+            db.query(MatchModel).filter(MatchModel.project_id == project_id).delete(synchronize_session=False)
+            db.add_all([
+                MatchModel(
+                    project_id=project_id,
+                    freelancer_id=int(match["freelancer_id"]),
+                    rank=rank,
+                    match_score=match["match_score"],
+                    prescore=match["prescore"],
+                    result=match,
+                    computed_at=now
+                )
+                for rank, match in enumerate(matches, start=1)
+            ])
+            # Resta dirty se nel frattempo è arrivata un'altra modifica
+            db.query(ProjectMatchStateModel).filter(
+                ProjectMatchStateModel.project_id == project_id,
+                ProjectMatchStateModel.dirty_version == seen_version
+            ).update({"dirty": False, "dirty_since": None, "refreshed_at": now}, synchronize_session=False)
+            db.query(ProjectMatchStateModel).filter(
+                ProjectMatchStateModel.project_id == project_id
+            ).update({"refreshed_at": now}, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _dirty_projects(self, limit: int = 20) -> List[int]:
+        db = SessionLocal()
+        try:
+            return [
+                project_id
+                for (project_id,) in db.query(ProjectMatchStateModel.project_id).filter(
+                    ProjectMatchStateModel.dirty == True  # noqa: E712
+                ).order_by(ProjectMatchStateModel.dirty_since).limit(limit).all()
+            ]
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(REFRESH_DEBOUNCE_SECONDS)
+            self._wakeup.clear()
+            try:
+                for project_id in await asyncio.to_thread(self._dirty_projects):
+                    await self.refresh_project(project_id)
+                if await asyncio.to_thread(self._dirty_projects, 1):
+                    self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing materialized matches: {str(e)}")
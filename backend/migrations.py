@@ -0,0 +1,227 @@
+"""
+Migrazioni versionate dello schema e backfill a blocchi.
+
+Ogni migrazione ha una versione crescente ed è registrata in `schema_migrations`
+una volta applicata; i passi sono idempotenti, quindi rieseguirli è sicuro.
+I backfill processano le tabelle per ID in blocchi limitati, ognuno nella propria
+transazione breve, salvando un checkpoint per riprendere dopo un'interruzione.
+
+Uso: python migrations.py [status|upgrade]
+"""
+
+from typing import Callable, Iterable, List, Sequence, Tuple
+import json
+import logging
+import os
+import sys
+import time
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection, Engine
+from database import (
+    engine, Base, FreelancerModel, ProjectModel, SkillModel, FreelancerSkillModel, ProjectSkillModel,
+    SchemaMigrationModel, BackfillCheckpointModel
+)
+from skills_store import normalize_skills
+from search_index import create_search_tables, index_rows
+from change_versions import TRACKED_TABLES, create_version_triggers
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "500"))
+# Pausa tra un blocco e l'altro per lasciare spazio alle scritture dell'API
+BACKFILL_PAUSE_SECONDS = float(os.getenv("BACKFILL_PAUSE_SECONDS", "0.01"))
+
+class Migration:
+    def __init__(self, version: int, name: str, upgrade: Callable[[Engine], None]):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+
+def column_names(conn: Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})").fetchall()]
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl_type: str) -> None:
+    if column not in column_names(conn, table):
+        logger.info(f"Aggiunta colonna {table}.{column}")
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}")
+
+def batched_backfill(
+    name: str,
+    table,
+    process_batch: Callable[[Connection, Sequence], None],
+    columns: Iterable = (),
+    bind: Engine = engine,
+    batch_size: int = BACKFILL_BATCH_SIZE,
+    pause_seconds: float = BACKFILL_PAUSE_SECONDS
+) -> int:
+    """
+    Walk `table` in primary key order, `batch_size` rows at a time, calling
+    `process_batch(conn, rows)` inside one short transaction per batch. The
+    checkpoint in `backfill_checkpoints` is advanced in the same transaction,
+    so an interrupted backfill resumes after the last committed batch.
+    Returns the total number of rows processed.
+    """
+    checkpoints = BackfillCheckpointModel.__table__
+    with bind.begin() as conn:
+        conn.execute(insert(checkpoints).values(
+            name=name, last_id=0, processed=0, completed=False, updated_at=time.time()
+        ).on_conflict_do_nothing())
+        checkpoint = conn.execute(select(checkpoints).where(checkpoints.c.name == name)).one()
+    if checkpoint.completed:
+        return checkpoint.processed
+
+    last_id, processed = checkpoint.last_id, checkpoint.processed
+    selected = [table.c.id, *columns]
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(*selected).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            ).all()
+            if rows:
+                process_batch(conn, rows)
+                last_id, processed = rows[-1].id, processed + len(rows)
+            conn.execute(update(checkpoints).where(checkpoints.c.name == name).values(
+                last_id=last_id, processed=processed, completed=not rows, updated_at=time.time()
+            ))
+        if not rows:
+            logger.info(f"Backfill {name} completato: {processed} righe")
+            return processed
+        logger.info(f"Backfill {name}: {processed} righe, ultimo ID {last_id}")
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+def _as_list(value) -> list:
+    # Alcune righe storiche hanno il JSON salvato come stringa
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
+
+def _write_skill_rows(conn: Connection, association, owner_column: str, owners: List[Tuple[int, List[str]]]) -> None:
+    skills = SkillModel.__table__
+    table = association.__table__
+    names = sorted({name for _, owner_skills in owners for name in owner_skills})
+    if names:
+        conn.execute(insert(skills).values([{"name": name} for name in names]).on_conflict_do_nothing())
+    skill_ids = dict(conn.execute(select(skills.c.name, skills.c.id).where(skills.c.name.in_(names))).all()) if names else {}
+    conn.execute(delete(table).where(table.c[owner_column].in_([owner_id for owner_id, _ in owners])))
+    values = [
+        {owner_column: owner_id, "skill_id": skill_ids[name]}
+        for owner_id, owner_skills in owners
+        for name in owner_skills
+    ]
+    if values:
+        conn.execute(insert(table).values(values))
+
+def _backfill_skills(bind: Engine) -> None:
+    freelancers = FreelancerModel.__table__
+    projects = ProjectModel.__table__
+    batched_backfill(
+        "freelancer_skills",
+        freelancers,
+        lambda conn, rows: _write_skill_rows(
+            conn, FreelancerSkillModel, "freelancer_id",
+            [(row.id, normalize_skills(_as_list(row.skills))) for row in rows]
+        ),
+        columns=[freelancers.c.skills],
+        bind=bind
+    )
+    batched_backfill(
+        "project_skills",
+        projects,
+        lambda conn, rows: _write_skill_rows(
+            conn, ProjectSkillModel, "project_id",
+            [(row.id, normalize_skills(_as_list(row.required_skills))) for row in rows]
+        ),
+        columns=[projects.c.required_skills],
+        bind=bind
+    )
+
+def _create_base_schema(bind: Engine) -> None:
+    # Crea solo le tabelle mancanti: sui database esistenti non tocca nulla.
+    # Le tabelle aggiunte in seguito vanno create da una nuova migrazione
+    Base.metadata.create_all(bind=bind)
+
+def _add_project_assignment_columns(bind: Engine) -> None:
+    # Sostituisce lo script database-migration.py
+    with bind.begin() as conn:
+        add_column_if_missing(conn, "projects", "company_email", "VARCHAR")
+        add_column_if_missing(conn, "projects", "freelancer_email", "VARCHAR")
+
+def _add_list_filter_indexes(bind: Engine) -> None:
+    # Stessi nomi degli indici dichiarati nei modelli, creati dalla migrazione 0 sui database nuovi
+    with bind.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_freelancers_hourly_rate ON freelancers (hourly_rate)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_projects_budget ON projects (budget)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_projects_company_email ON projects (company_email)")
+        conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_projects_freelancer_email ON projects (freelancer_email)")
+
+def _create_search_index(bind: Engine) -> None:
+    with bind.begin() as conn:
+        create_search_tables(conn)
+    # I trigger coprono le nuove scritture, il backfill indicizza le righe esistenti
+    for fts_table, model in (("freelancers_fts", FreelancerModel), ("projects_fts", ProjectModel)):
+        batched_backfill(
+            fts_table,
+            model.__table__,
+            lambda conn, rows, fts_table=fts_table: index_rows(conn, fts_table, [row.id for row in rows]),
+            bind=bind
+        )
+
+def _add_change_versions(bind: Engine) -> None:
+    with bind.begin() as conn:
+        for table in TRACKED_TABLES:
+            add_column_if_missing(conn, table, "version", "INTEGER NOT NULL DEFAULT 1")
+        create_version_triggers(conn)
+
+MIGRATIONS: List[Migration] = [
+    Migration(0, "base_schema", _create_base_schema),
+    Migration(1, "projects_assignment_columns", _add_project_assignment_columns),
+    Migration(2, "backfill_normalized_skills", _backfill_skills),
+    Migration(3, "list_filter_indexes", _add_list_filter_indexes),
+    Migration(4, "fts5_search_index", _create_search_index),
+    Migration(5, "change_versions", _add_change_versions),
+]
+
+def applied_versions(bind: Engine = engine) -> List[int]:
+    migrations = SchemaMigrationModel.__table__
+    # Su un database nuovo la tabella non esiste ancora: la migrazione 0 crea il resto
+    migrations.create(bind=bind, checkfirst=True)
+    with bind.connect() as conn:
+        return [version for (version,) in conn.execute(select(migrations.c.version).order_by(migrations.c.version))]
+
+def run_migrations(bind: Engine = engine) -> List[int]:
+    """
+    Apply the pending migrations in version order and return their versions
+    """
+    migrations = SchemaMigrationModel.__table__
+    applied = set(applied_versions(bind))
+    newly_applied = []
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+        logger.info(f"Migrazione {migration.version}: {migration.name}")
+        migration.upgrade(bind)
+        with bind.begin() as conn:
+            conn.execute(insert(migrations).values(
+                version=migration.version, name=migration.name, applied_at=time.time()
+            ).on_conflict_do_nothing())
+        newly_applied.append(migration.version)
+    return newly_applied
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "upgrade":
+        applied = run_migrations()
+        print(f"Migrazioni applicate: {applied or 'nessuna'}")
+    elif command == "status":
+        applied = set(applied_versions())
+        for migration in MIGRATIONS:
+            print(f"{migration.version:4d}  {'applicata' if migration.version in applied else 'da applicare':12s}  {migration.name}")
+    else:
+        print("Uso: python migrations.py [status|upgrade]")
+        sys.exit(1)
@@ -0,0 +1,45 @@
+from typing import List, Optional
+from fastapi import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+MAX_PAGE_SIZE = 200
+# Il corpo delle liste resta un array JSON: il cursore della pagina successiva va in un header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Per i risultati ordinati per rilevanza (ricerca) la pagina successiva si chiede per offset
+NEXT_OFFSET_HEADER = "X-Next-Offset"
+MAX_SEARCH_OFFSET = 1000
+
+async def keyset_page(
+    db: AsyncSession,
+    query,
+    id_column,
+    after: Optional[int],
+    limit: Optional[int],
+    response: Response,
+    scalars: bool = True
+) -> List:
+    """
+    One page of `query` ordered by primary key, starting after the `after` id.
+    Sets NEXT_CURSOR_HEADER to the last id of the page when more rows follow.
+    Pagination is opt-in: with `limit=None` every row after `after` is returned.
+    With `scalars=False` the query selects columns and must select the id first.
+    """
+    if after is not None:
+        query = query.where(id_column > after)
+    query = query.order_by(id_column)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query = query.limit(limit + 1)
+    rows = (await db.scalars(query)).all() if scalars else (await db.execute(query)).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = str(rows[-1].id if scalars else rows[-1][0])
+    return rows
+
+def offset_page(rows: List, limit: int, offset: int, response: Response) -> List:
+    """
+    Trim rows fetched with `limit + 1` to one page, setting NEXT_OFFSET_HEADER when more follow
+    """
+    if len(rows) > limit:
+        response.headers[NEXT_OFFSET_HEADER] = str(offset + limit)
+    return rows[:limit]
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+from passlib.context import CryptContext
+
+# Costo bcrypt (log2 delle iterazioni): cambiandolo, gli hash esistenti vengono
+# ricalcolati al login successivo
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt rilascia il GIL: bastano dei thread, uno per core
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Richieste in coda o in esecuzione oltre le quali si risponde subito 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    """
+    Runs bcrypt hash/verify in a dedicated thread pool so logins never
+    block the event loop. At most `max_pending` operations may be queued
+    or running; beyond that callers are rejected with PasswordHasherBusy.
+    """
+
+    def __init__(
+        self,
+        rounds: int = BCRYPT_ROUNDS,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING
+    ):
+        self.rounds = rounds
+        # min = max = costo configurato: passlib segnala da aggiornare solo gli hash fuori da questi limiti
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.queue_seconds = 0.0
+        self.hash_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """
+        Check `password` against `hashed`; when it matches but the hash uses
+        an outdated cost or scheme, also return the replacement hash
+        """
+        if not hashed:
+            return False, None
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed)
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy(f"{self.pending} operazioni di hashing in attesa")
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self.pending += 1
+        self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+            try:
+                return fn(*args), started - submitted, time.perf_counter() - started
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        # Se la richiesta viene cancellata un job già avviato continua nel pool:
+        # il contatore scende quando il job finisce (o viene annullato prima di partire)
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(timed)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        result, waited, elapsed = await asyncio.wrap_future(future)
+        self.completed += 1
+        self.queue_seconds += waited
+        self.hash_seconds += elapsed
+        return result
+
+    def _release(self) -> None:
+        self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self.pending,
+            "running": self.running,
+            "queued": max(self.pending - self.running, 0),
+            "max_pending": self.max_pending,
+            "max_pending_seen": self.max_pending_seen,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "avg_queue_ms": round(self.queue_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_hash_ms": round(self.hash_seconds / self.completed * 1000, 2) if self.completed else 0.0
+        }
+
+password_hasher = PasswordHasher()
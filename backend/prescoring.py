@@ -0,0 +1,260 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import re
+import numpy as np
+from database import SessionLocal, FreelancerModel
+from skill_index import skill_index, normalize_skill
+from vector_index import freelancer_index, project_text
+
+logger = logging.getLogger(__name__)
+
+# Pesi dei segnali deterministici (somma = 1)
+SIGNAL_WEIGHTS = {
+    "skills": 0.45,
+    "semantic": 0.20,
+    "rate": 0.15,
+    "availability": 0.10,
+    "experience": 0.10
+}
+# Ore stimate quando la timeline del progetto non è interpretabile
+DEFAULT_PROJECT_HOURS = 160.0
+HOURS_PER_WEEK = 40.0
+
+def parse_budget(project: Dict) -> Optional[float]:
+    """
+    Return the project budget, from `budget` or the upper end of `budget_range`
+    """
+    budget = project.get("budget")
+    if isinstance(budget, (int, float)):
+        return float(budget)
+    amounts = []
+    for number, thousands in re.findall(r"(\d+(?:[.,]\d+)?)\s*([kK])?", str(project.get("budget_range") or "")):
+        if thousands:
+            # "1,5k" e "1.5k" = 1500
+            amounts.append(float(number.replace(",", ".")) * 1000)
+        else:
+            # "1,500" = 1500
+            amounts.append(float(number.replace(",", "")))
+    return max(amounts) if amounts else None
+
+def parse_hours(timeline: Optional[str]) -> float:
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(day|giorn|week|settiman|month|mes)", str(timeline or "").lower())
+    if not match:
+        return DEFAULT_PROJECT_HOURS
+    value, unit = float(match.group(1)), match.group(2)
+    if unit in ("day", "giorn"):
+        return value * 8
+    if unit in ("week", "settiman"):
+        return value * HOURS_PER_WEEK
+    return value * 4 * HOURS_PER_WEEK
+
+def availability_signal(availability: Optional[str]) -> float:
+    text = str(availability or "").lower()
+    if not text:
+        return 0.5
+    if any(w in text for w in ("not", "unavailable", "non disponibile", "busy")):
+        return 0.0
+    if any(w in text for w in ("part", "parziale")):
+        return 0.6
+    return 1.0
+
+def experience_signal(experience: Optional[str]) -> float:
+    text = str(experience or "").lower()
+    match = re.search(r"(\d+(?:\.\d+)?)\s*\+?\s*(years|year|anni|anno)", text)
+    if match:
+        return min(float(match.group(1)) / 10.0, 1.0)
+    return 0.3 if text.strip() else 0.0
+
+class FreelancerPrescorer:
+    """
+    Deterministic, NumPy-vectorized scoring of one project against all freelancers.
+
+    Per-freelancer features (hourly rate, availability, experience) are kept
+    in column arrays aligned with `_ids`; skill overlap comes from the skill
+    index postings and semantic similarity from the freelancer vector index.
+    The cheap retrieval signals are computed first and used to prune with an
+    upper bound before the remaining signals are scored.
+    """
+
+    def __init__(self):
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+        self._hourly_rate = np.zeros(0, dtype=np.float32)
+        self._availability = np.zeros(0, dtype=np.float32)
+        self._experience = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def rebuild(self) -> None:
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                FreelancerModel.id, FreelancerModel.hourly_rate,
+                FreelancerModel.availability, FreelancerModel.experience
+            ).order_by(FreelancerModel.id).all()
+        finally:
+            db.close()
+
+        self._ids = np.array([r.id for r in rows], dtype=np.int64)
+        self._positions = {int(i): p for p, i in enumerate(self._ids)}
+        self._hourly_rate = np.array(
+            [r.hourly_rate if r.hourly_rate is not None else np.nan for r in rows], dtype=np.float32
+        )
+        self._availability = np.array([availability_signal(r.availability) for r in rows], dtype=np.float32)
+        self._experience = np.array([experience_signal(r.experience) for r in rows], dtype=np.float32)
+
+    def update(self, freelancer_id: int, hourly_rate: Optional[float], availability: Optional[str], experience: Optional[str]) -> None:
+        self.update_many([(freelancer_id, hourly_rate, availability, experience)])
+
+    def update_many(self, rows: Iterable[Tuple[int, Optional[float], Optional[str], Optional[str]]]) -> None:
+        """
+        Update the features of several freelancers, (id, hourly_rate,
+        availability, experience) each, appending the new ones in one step
+        """
+        # Un ID nuovo ripetuto nella stessa chiamata tiene gli ultimi valori
+        new_rows: Dict[int, Tuple[float, float, float]] = {}
+        for freelancer_id, hourly_rate, availability, experience in rows:
+            values = (
+                hourly_rate if hourly_rate is not None else np.nan,
+                availability_signal(availability),
+                experience_signal(experience)
+            )
+            position = self._positions.get(freelancer_id)
+            if position is None:
+                new_rows[freelancer_id] = values
+            else:
+                self._hourly_rate[position], self._availability[position], self._experience[position] = values
+        if new_rows:
+            for offset, freelancer_id in enumerate(new_rows):
+                self._positions[freelancer_id] = len(self._ids) + offset
+            ids = list(new_rows)
+            hourly_rates, availabilities, experiences = zip(*new_rows.values())
+            self._ids = np.append(self._ids, np.array(ids, dtype=np.int64))
+            self._hourly_rate = np.append(self._hourly_rate, np.array(hourly_rates, dtype=np.float32))
+            self._availability = np.append(self._availability, np.array(availabilities, dtype=np.float32))
+            self._experience = np.append(self._experience, np.array(experiences, dtype=np.float32))
+
+    def _skill_scores(self, required_skills: Iterable[str]) -> np.ndarray:
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        required = {normalize_skill(s) for s in required_skills if s and str(s).strip()}
+        if not required:
+            return scores
+        weights = {skill: skill_index.skill_weight(skill) for skill in required}
+        for skill, weight in weights.items():
+            positions = [self._positions[i] for i in skill_index.ids_with(skill) if i in self._positions]
+            scores[np.array(positions, dtype=np.int64)] += weight
+        return scores / sum(weights.values())
+
+    def _semantic_scores(self, project: Dict) -> np.ndarray:
+        scores = np.zeros(len(self._ids), dtype=np.float32)
+        text = project_text(project.get("title"), project.get("description"), project.get("required_skills"))
+        ids, similarities = freelancer_index.similarities(text)
+        if not len(ids):
+            return scores
+        # Allinea gli ID del vector index alle posizioni del prescorer
+        sorter = np.argsort(ids)
+        found = sorter[np.clip(np.searchsorted(ids, self._ids, sorter=sorter), 0, len(ids) - 1)]
+        valid = ids[found] == self._ids
+        scores[valid] = np.maximum(similarities[found[valid]], 0.0)
+        return scores
+
+    def _rate_scores(self, positions: np.ndarray, project: Dict) -> np.ndarray:
+        rates = self._hourly_rate[positions]
+        budget = parse_budget(project)
+        if budget is None:
+            return np.full(len(positions), 0.5, dtype=np.float32)
+        max_rate = budget / parse_hours(project.get("timeline"))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fit = np.clip(max_rate / rates, 0.0, 1.0)
+        return np.where(np.isnan(rates) | (rates <= 0), 0.5, fit).astype(np.float32)
+
+    def prescore_for(
+        self,
+        project: Dict,
+        freelancer_ids: Iterable[int],
+        project_vector: Optional[np.ndarray] = None
+    ) -> Dict[int, float]:
+        """
+        Prescore (0-10, as in score()) of the given freelancers only.
+        `project_vector` is the project's embedding, if already known.
+        """
+        ids = [freelancer_id for freelancer_id in freelancer_ids if freelancer_id in self._positions]
+        if not ids:
+            return {}
+        positions = np.array([self._positions[freelancer_id] for freelancer_id in ids], dtype=np.int64)
+
+        skills = np.zeros(len(ids), dtype=np.float32)
+        required = {normalize_skill(s) for s in project.get("required_skills") or [] if s and str(s).strip()}
+        if required:
+            weights = {skill: skill_index.skill_weight(skill) for skill in required}
+            for skill, weight in weights.items():
+                holders = skill_index.ids_with(skill)
+                skills += weight * np.array([freelancer_id in holders for freelancer_id in ids], dtype=np.float32)
+            skills /= sum(weights.values())
+
+        if project_vector is None:
+            project_vector = freelancer_index.embedder.embed([
+                project_text(project.get("title"), project.get("description"), project.get("required_skills"))
+            ])[0]
+        semantic = np.zeros(len(ids), dtype=np.float32)
+        for i, freelancer_id in enumerate(ids):
+            vector = freelancer_index.vector_for(freelancer_id)
+            if vector is not None:
+                semantic[i] = max(float(vector @ project_vector), 0.0)
+
+        total = (
+            SIGNAL_WEIGHTS["skills"] * skills
+            + SIGNAL_WEIGHTS["semantic"] * semantic
+            + SIGNAL_WEIGHTS["rate"] * self._rate_scores(positions, project)
+            + SIGNAL_WEIGHTS["availability"] * self._availability[positions]
+            + SIGNAL_WEIGHTS["experience"] * self._experience[positions]
+        )
+        return {freelancer_id: round(float(value) * 10, 2) for freelancer_id, value in zip(ids, total)}
+
+    def score(self, project: Dict, k: int = 20) -> List[Dict]:
+        """
+        Return the top-k freelancers for a project as dicts with
+        `freelancer_id`, `prescore` (0-10) and the per-signal breakdown
+        """
+        if not len(self._ids) or k <= 0:
+            return []
+
+        skills = self._skill_scores(project.get("required_skills") or [])
+        semantic = self._semantic_scores(project)
+        partial = SIGNAL_WEIGHTS["skills"] * skills + SIGNAL_WEIGHTS["semantic"] * semantic
+
+        # Upper bound: i segnali restanti valgono al massimo la somma dei loro pesi.
+        # Chi non può superare il k-esimo punteggio parziale viene scartato.
+        remaining = SIGNAL_WEIGHTS["rate"] + SIGNAL_WEIGHTS["availability"] + SIGNAL_WEIGHTS["experience"]
+        k = min(k, len(partial))
+        kth_lower_bound = np.partition(partial, len(partial) - k)[len(partial) - k]
+        survivors = np.nonzero(partial + remaining >= kth_lower_bound)[0]
+
+        rate = self._rate_scores(survivors, project)
+        availability = self._availability[survivors]
+        experience = self._experience[survivors]
+        total = (
+            partial[survivors]
+            + SIGNAL_WEIGHTS["rate"] * rate
+            + SIGNAL_WEIGHTS["availability"] * availability
+            + SIGNAL_WEIGHTS["experience"] * experience
+        )
+
+        top = np.argsort(-total, kind="stable")[:k]
+        return [
+            {
+                "freelancer_id": int(self._ids[survivors[i]]),
+                "prescore": round(float(total[i]) * 10, 2),
+                "signals": {
+                    "skills": round(float(skills[survivors[i]]), 3),
+                    "semantic": round(float(semantic[survivors[i]]), 3),
+                    "rate": round(float(rate[i]), 3),
+                    "availability": round(float(availability[i]), 3),
+                    "experience": round(float(experience[i]), 3)
+                }
+            }
+            for i in top
+        ]
+
+prescorer = FreelancerPrescorer()
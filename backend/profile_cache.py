@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import os
+import time
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+# Limita quanto può restare vecchio un profilo modificato da un altro processo
+DEFAULT_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+
+class ProfileCache:
+    """
+    In-process LRU of serialized /api/profiles/me responses, keyed by
+    (user_type, email) and holding (etag, JSON bytes). Entries expire
+    after a TTL and are dropped by the writes that change a profile.
+    A read-through fill passes the generation() taken before its DB read
+    to set(), which skips it if the profile was invalidated meanwhile.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        # Generazione per chiave, assegnata a ogni invalidate da un contatore crescente;
+        # le chiavi scartate dall'LRU alzano il minimo restituito per tutte le altre
+        self._generations: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._counter = 0
+        self._generation_floor = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_type: str, email: str) -> Optional[Tuple[str, bytes]]:
+        key = (user_type, email)
+        entry = self._entries.get(key)
+        if entry is not None:
+            etag, body, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return etag, body
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def generation(self, user_type: str, email: str) -> int:
+        return self._generations.get((user_type, email), self._generation_floor)
+
+    def set(self, user_type: str, email: str, etag: str, body: bytes, generation: Optional[int] = None) -> None:
+        key = (user_type, email)
+        if generation is not None and generation != self.generation(user_type, email):
+            # Il profilo è cambiato durante la lettura dal DB: questo corpo è già vecchio
+            return
+        self._entries[key] = (etag, body, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_type: str, emails: Iterable[str]) -> None:
+        for email in emails:
+            key = (user_type, email)
+            self._entries.pop(key, None)
+            self._counter += 1
+            self._generations[key] = self._counter
+            self._generations.move_to_end(key)
+        while len(self._generations) > self.max_entries:
+            _, generation = self._generations.popitem(last=False)
+            self._generation_floor = max(self._generation_floor, generation)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generations.clear()
+        self._counter += 1
+        self._generation_floor = self._counter
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+profile_cache = ProfileCache()
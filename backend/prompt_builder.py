@@ -0,0 +1,145 @@
+from typing import Any, Dict, List, Optional
+import json
+import math
+import os
+from textwrap import dedent
+
+# Budget massimo (token stimati) per i dati di profilo/analisi inseriti in un prompt
+PROMPT_DATA_TOKEN_BUDGET = int(os.getenv("PROMPT_DATA_TOKEN_BUDGET", "1200"))
+# Lunghezza massima di un singolo campo testuale prima del troncamento
+MAX_FIELD_CHARS = 600
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (~4 characters per token for English/Italian text)
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def build_prompt(template: str) -> str:
+    """
+    Strip the indentation the prompt templates inherit from the source code
+    """
+    return dedent(template).strip()
+
+def _prune(value: Any, max_chars: int) -> Any:
+    """
+    Drop empty values and truncate long strings, recursively
+    """
+    if isinstance(value, dict):
+        pruned = {k: _prune(v, max_chars) for k, v in value.items()}
+        return {k: v for k, v in pruned.items() if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [v for v in (_prune(v, max_chars) for v in value) if v not in (None, "", [], {})]
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value if len(value) <= max_chars else value[:max_chars - 1] + "…"
+    return value
+
+def compact_json(data: Any, max_tokens: Optional[int] = None) -> str:
+    """
+    Serialize without indentation or empty fields. If `max_tokens` is given,
+    long strings and then trailing list items are trimmed until it fits.
+    """
+    max_chars = MAX_FIELD_CHARS
+    while True:
+        pruned = _prune(data, max_chars)
+        text = json.dumps(pruned, ensure_ascii=False, separators=(",", ":"))
+        if max_tokens is None or estimate_tokens(text) <= max_tokens or max_chars <= 80:
+            break
+        max_chars //= 2
+    if max_tokens is not None:
+        text = _trim_lists(pruned, max_tokens, text)
+    return text
+
+def _trim_lists(data: Any, max_tokens: int, text: str) -> str:
+    # Rimuove elementi dalla coda della lista più lunga finché il testo non rientra nel budget
+    while estimate_tokens(text) > max_tokens:
+        longest = _longest_list(data)
+        if longest is None or not longest:
+            break
+        longest.pop()
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return text
+
+def _longest_list(data: Any) -> Optional[List]:
+    best = None
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            if best is None or len(item) > len(best):
+                best = item
+            stack.extend(item)
+        elif isinstance(item, dict):
+            stack.extend(item.values())
+    return best
+
+def compact_profile(profile_data: Dict, max_tokens: int = PROMPT_DATA_TOKEN_BUDGET) -> str:
+    """
+    Compact freelancer profile for prompts: only the fields the models use,
+    with portfolio descriptions truncated and extra items dropped to fit
+    """
+    portfolio = profile_data.get("portfolio") or []
+    if isinstance(portfolio, str):
+        try:
+            portfolio = json.loads(portfolio)
+        except ValueError:
+            portfolio = []
+    compact = {
+        k: v for k, v in profile_data.items()
+        if k not in ("portfolio", "password", "email", "id")
+    }
+    compact["portfolio"] = [
+        {
+            "title": item.get("title"),
+            "description": item.get("description"),
+            "technologies": item.get("technologies")
+        } if isinstance(item, dict) else item
+        for item in portfolio
+    ]
+    return compact_json(compact, max_tokens=max_tokens)
+
+class TokenMeter:
+    """
+    Per-call-site accounting of input/output tokens and latency
+    """
+
+    def __init__(self):
+        self._sites: Dict[str, Dict[str, float]] = {}
+
+    def record(
+        self,
+        call_site: str,
+        input_tokens: int,
+        output_tokens: int,
+        latency_seconds: float = 0.0,
+        cached: bool = False
+    ) -> None:
+        site = self._sites.setdefault(call_site, {
+            "calls": 0, "cached_calls": 0, "input_tokens": 0, "output_tokens": 0,
+            "max_input_tokens": 0, "total_latency_seconds": 0.0
+        })
+        site["calls"] += 1
+        if cached:
+            site["cached_calls"] += 1
+            return
+        site["input_tokens"] += input_tokens
+        site["output_tokens"] += output_tokens
+        site["max_input_tokens"] = max(site["max_input_tokens"], input_tokens)
+        site["total_latency_seconds"] += latency_seconds
+
+    def stats(self) -> Dict[str, Dict]:
+        result = {}
+        for call_site, site in self._sites.items():
+            upstream = site["calls"] - site["cached_calls"]
+            result[call_site] = {
+                **site,
+                "total_latency_seconds": round(site["total_latency_seconds"], 3),
+                "avg_input_tokens": round(site["input_tokens"] / upstream, 1) if upstream else 0,
+                "avg_output_tokens": round(site["output_tokens"] / upstream, 1) if upstream else 0,
+                "avg_latency_seconds": round(site["total_latency_seconds"] / upstream, 3) if upstream else 0
+            }
+        return result
+
+token_meter = TokenMeter()
@@ -4,8 +4,10 @@ from typing import Optional
 import os
 import jwt
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-from database import SessionLocal, FreelancerModel, CompanyModel
+from sqlalchemy import literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, FreelancerModel, CompanyModel
+from password_hashing import password_hasher, PasswordHasherBusy
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -13,13 +15,12 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # JWT settings
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key")  # Usa una variabile d'ambiente in produzione
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_MINUTES = 60 * 24  # 24 ore
+# Account di servizio (es. bulk_cli): non si registrano né fanno login, il token si genera con create_service_token
+SERVICE_USER_TYPE = "Service"
 
 class UserLogin(BaseModel):
     email: str
@@ -41,23 +42,25 @@ def create_jwt_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
+def create_service_token(name: str) -> str:
+    return create_jwt_token({"sub": name, "user_type": SERVICE_USER_TYPE})
+
 @router.post("/register", response_model=Token)
-async def register_user(user: UserRegister):
-    db = SessionLocal()
+async def register_user(user: UserRegister, db: AsyncSession = Depends(get_async_db)):
     try:
         logger.debug(f"Registrazione utente: {user.email}, tipo: {user.user_type}")
         
         # Controlla se l'utente esiste già
         if user.user_type == "Freelancer":
-            existing_user = db.query(FreelancerModel).filter(FreelancerModel.email == user.email).first()
+            existing_user = await db.scalar(select(FreelancerModel).where(FreelancerModel.email == user.email))
         else:
-            existing_user = db.query(CompanyModel).filter(CompanyModel.email == user.email).first()
+            existing_user = await db.scalar(select(CompanyModel).where(CompanyModel.email == user.email))
             
         if existing_user:
             raise HTTPException(status_code=400, detail="Email già registrata")
         
-        # Hash della password
-        hashed_password = pwd_context.hash(user.password)
+        # Hash della password, fuori dall'event loop
+        hashed_password = await password_hasher.hash(user.password)
         
         # Crea il nuovo utente
         if user.user_type == "Freelancer":
@@ -79,45 +82,64 @@ async def register_user(user: UserRegister):
             )
             
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         
-        # Crea il token JWT
-        token = create_jwt_token({"sub": user.email, "user_type": user.user_type})
+        # Crea il token JWT con il tipo effettivamente salvato, non quello dichiarato nella richiesta
+        token = create_jwt_token({"sub": user.email, "user_type": new_user.user_type})
         logger.info(f"Utente registrato con successo: {user.email}")
         
-        return {"token": token, "user_type": user.user_type}
+        return {"token": token, "user_type": new_user.user_type}
+    except HTTPException:
+        await db.rollback()
+        raise
+    except PasswordHasherBusy as e:
+        logger.warning(f"Registrazione rifiutata, hashing saturo: {str(e)}")
+        raise HTTPException(status_code=503, detail="Servizio occupato, riprova", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Errore durante la registrazione: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Errore durante la registrazione: {str(e)}")
-    finally:
-        db.close()
 
 @router.post("/login", response_model=Token)
-async def login_user(user: UserLogin):
-    db = SessionLocal()
+async def login_user(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
     try:
         logger.debug(f"Login tentato per: {user.email}")
         
-        # Cerca l'utente come freelancer
-        freelancer = db.query(FreelancerModel).filter(FreelancerModel.email == user.email).first()
-        if freelancer and pwd_context.verify(user.password, freelancer.password):
-            token = create_jwt_token({"sub": user.email, "user_type": "Freelancer"})
-            logger.info(f"Login freelancer: {user.email}")
-            return {"token": token, "user_type": "Freelancer"}
-            
-        # Cerca l'utente come azienda
-        company = db.query(CompanyModel).filter(CompanyModel.email == user.email).first()
-        if company and pwd_context.verify(user.password, company.password):
-            token = create_jwt_token({"sub": user.email, "user_type": "Company"})
-            logger.info(f"Login company: {user.email}")
-            return {"token": token, "user_type": "Company"}
+        # Una sola query sugli indici univoci delle email: prima il freelancer, poi l'azienda
+        accounts = (await db.execute(
+            select(literal("Freelancer").label("user_type"), FreelancerModel.id, FreelancerModel.password)
+            .where(FreelancerModel.email == user.email)
+            .union_all(
+                select(literal("Company").label("user_type"), CompanyModel.id, CompanyModel.password)
+                .where(CompanyModel.email == user.email)
+            )
+        )).all()
+        for user_type, user_id, hashed_password in sorted(accounts, key=lambda account: account.user_type != "Freelancer"):
+            valid, new_hash = await password_hasher.verify(user.password, hashed_password)
+            if not valid:
+                continue
+            if new_hash is not None:
+                # Hash con costo o schema superato: si aggiorna ora che la password è nota
+                model = FreelancerModel if user_type == "Freelancer" else CompanyModel
+                await db.execute(update(model).where(model.id == user_id).values(password=new_hash))
+                await db.commit()
+                logger.info(f"Hash della password aggiornato: {user.email}")
+            token = create_jwt_token({"sub": user.email, "user_type": user_type})
+            logger.info(f"Login {user_type.lower()}: {user.email}")
+            return {"token": token, "user_type": user_type}
             
         # Se l'autenticazione fallisce
         raise HTTPException(status_code=401, detail="Credenziali non valide")
+    except HTTPException:
+        raise
+    except PasswordHasherBusy as e:
+        logger.warning(f"Login rifiutato, hashing saturo: {str(e)}")
+        raise HTTPException(status_code=503, detail="Servizio occupato, riprova", headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Errore durante il login: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Errore durante il login: {str(e)}")
-    finally:
-        db.close()
\ No newline at end of file
+
+@router.get("/hash-stats")
+async def get_hash_stats():
+    return password_hasher.stats()
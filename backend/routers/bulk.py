@@ -0,0 +1,340 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from pydantic import ValidationError
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import os
+import jwt
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from database import AsyncSessionLocal, FreelancerModel, ProjectModel, CompanyModel, FreelancerSkillModel, ProjectSkillModel
+from skills_store import replace_skills_bulk
+from skill_index import skill_index, project_skill_index
+from vector_index import freelancer_index, project_index, freelancer_text, project_text
+from prescoring import prescorer
+from profile_cache import profile_cache
+from bulk_io import FORMATS, iter_lines, iter_records, last_per_key, encode_rows, csv_header
+from serialization import decode_json_list
+from routers.profiles import Freelancer
+from routers.projects import Project
+from routers.companies import Company
+from routers.matching import match_materializer
+from routers.auth import SERVICE_USER_TYPE
+import logging
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/bulk", tags=["bulk"])
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+# Righe validate e scritte per transazione: un errore del DB annulla solo il proprio blocco
+IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "500"))
+EXPORT_PAGE_SIZE = int(os.getenv("BULK_EXPORT_PAGE_SIZE", "1000"))
+# Errori riportati nella risposta; oltre si conta soltanto
+MAX_REPORTED_ERRORS = 1000
+
+# Nel CSV le celle vuote mancano del tutto: i campi testuali hanno default ""
+class ProjectImportRow(Project):
+    id: Optional[int] = None  # se presente aggiorna (o crea) il progetto con questo ID
+    description: str = ""
+    timeline: str = ""
+
+class CompanyImportRow(Company):
+    email: str
+    description: str = ""
+    industry: str = ""
+    size: str = ""
+    location: str = ""
+
+def _freelancer_row(record: Dict) -> Dict:
+    row = Freelancer(**record).to_db_dict()
+    row["user_type"] = "Freelancer"
+    return row
+
+def _project_row(record: Dict) -> Dict:
+    row = ProjectImportRow(**record).dict()
+    if row["id"] is None:
+        del row["id"]
+    return row
+
+def _company_row(record: Dict) -> Dict:
+    row = CompanyImportRow(**record).dict()
+    row["user_type"] = "Company"
+    return row
+
+async def _upsert(db, model, rows: List[Dict], key: str) -> List[int]:
+    """
+    Multi-row INSERT ... ON CONFLICT DO UPDATE, returning the ids in row order.
+    Columns missing from the rows (e.g. the password) are left untouched.
+    """
+    table = model.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key],
+        set_={column: statement.excluded[column] for column in rows[0] if column != key}
+    ).returning(table.c.id, sort_by_parameter_order=True)
+    return list((await db.execute(statement, rows)).scalars())
+
+async def _write_freelancers(db, rows: List[Dict]) -> List[int]:
+    ids = await _upsert(db, FreelancerModel, rows, "email")
+    await replace_skills_bulk(db, FreelancerSkillModel, "freelancer_id", list(zip(ids, (row["skills"] for row in rows))))
+    return ids
+
+async def _write_projects(db, rows: List[Dict]) -> List[int]:
+    # Le righe con e senza ID hanno colonne diverse: un'istruzione per gruppo
+    ids: Dict[int, int] = {}
+    for with_id in (True, False):
+        positions = [position for position, row in enumerate(rows) if ("id" in row) == with_id]
+        if not positions:
+            continue
+        group = [rows[position] for position in positions]
+        if with_id:
+            group_ids = await _upsert(db, ProjectModel, group, "id")
+        else:
+            table = ProjectModel.__table__
+            group_ids = list((await db.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), group
+            )).scalars())
+        ids.update(zip(positions, group_ids))
+    ordered = [ids[position] for position in range(len(rows))]
+    await replace_skills_bulk(db, ProjectSkillModel, "project_id", list(zip(ordered, (row["required_skills"] for row in rows))))
+    return ordered
+
+async def _write_companies(db, rows: List[Dict]) -> List[int]:
+    return await _upsert(db, CompanyModel, rows, "email")
+
+async def _index_freelancers(items: List[Tuple[int, Dict]]) -> None:
+    profile_cache.invalidate("Freelancer", (row["email"] for _, row in items))
+    for freelancer_id, row in items:
+        skill_index.update(freelancer_id, row["skills"])
+    await freelancer_index.upsert_many({
+        freelancer_id: freelancer_text(row["skills"], row["experience"], row["portfolio"])
+        for freelancer_id, row in items
+    })
+    prescorer.update_many(
+        (freelancer_id, row["hourly_rate"], row["availability"], row["experience"]) for freelancer_id, row in items
+    )
+    await match_materializer.mark_freelancers_dirty([
+        (freelancer_id, row["skills"], row["experience"], row["portfolio"]) for freelancer_id, row in items
+    ])
+
+async def _index_projects(items: List[Tuple[int, Dict]]) -> None:
+    await project_index.upsert_many({
+        project_id: project_text(row["title"], row["description"], row["required_skills"])
+        for project_id, row in items
+    })
+    for project_id, row in items:
+        project_skill_index.update(project_id, row["required_skills"])
+    await match_materializer.mark_projects_dirty(project_id for project_id, _ in items)
+
+async def _index_companies(items: List[Tuple[int, Dict]]) -> None:
+    profile_cache.invalidate("Company", (row["email"] for _, row in items))
+
+class BulkEntity:
+    """
+    How one table is imported (upsert key, row schema, batched write,
+    in-memory index refresh) and exported (columns, keyset-paged by id)
+    """
+
+    def __init__(
+        self,
+        model,
+        key: str,
+        to_row: Callable[[Dict], Dict],
+        write: Callable,
+        export_fields: Sequence[str],
+        list_fields: Sequence[str] = (),
+        json_fields: Sequence[str] = (),
+        reindex: Optional[Callable[[List[Tuple[int, Dict]]], Awaitable[None]]] = None
+    ):
+        self.model = model
+        self.key = key
+        self.to_row = to_row
+        self.write = write
+        self.export_fields = export_fields
+        self.list_fields = list_fields
+        self.json_fields = json_fields
+        self.reindex = reindex
+
+# La password non viene né importata né esportata
+ENTITIES = {
+    "freelancers": BulkEntity(
+        FreelancerModel, "email", _freelancer_row, _write_freelancers,
+        ("id", "email", "experience", "skills", "portfolio", "hourly_rate", "availability"),
+        list_fields=("skills",), json_fields=("portfolio",), reindex=_index_freelancers
+    ),
+    "projects": BulkEntity(
+        ProjectModel, "id", _project_row, _write_projects,
+        ("id", "title", "description", "budget", "timeline", "required_skills", "company_email", "freelancer_email"),
+        list_fields=("required_skills",), reindex=_index_projects
+    ),
+    "companies": BulkEntity(
+        CompanyModel, "email", _company_row, _write_companies,
+        ("id", "email", "name", "description", "industry", "size", "location"),
+        reindex=_index_companies
+    ),
+}
+
+def _get_entity(entity: str, fmt: str) -> BulkEntity:
+    if entity not in ENTITIES:
+        raise HTTPException(status_code=404, detail=f"Entità sconosciuta: {entity}. Disponibili: {', '.join(ENTITIES)}")
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato non valido: {fmt}. Disponibili: {', '.join(FORMATS)}")
+    return ENTITIES[entity]
+
+def _check_token(token: str) -> None:
+    try:
+        payload = jwt.decode(token, os.getenv("JWT_SECRET", "your-secret-key"), algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Token invalido")
+    # Import ed export toccano tutti gli account: non bastano i token di freelancer e aziende
+    if payload.get("user_type") != SERVICE_USER_TYPE:
+        raise HTTPException(status_code=403, detail="Import ed export in blocco riservati agli account di servizio")
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}" for detail in error.errors()
+    )
+
+class ImportSummary:
+    def __init__(self, entity: str):
+        self.entity = entity
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict] = []
+
+    def error(self, row: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def to_dict(self) -> Dict:
+        return {
+            "entity": self.entity,
+            "processed": self.processed,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+async def _write_chunk(entity: BulkEntity, chunk: List[Tuple[int, Dict]], summary: ImportSummary) -> None:
+    """
+    Write one chunk in a single transaction; if the database rejects it,
+    retry row by row so only the offending rows are reported
+    """
+    async def write(rows: List[Tuple[int, Dict]]) -> List[int]:
+        async with AsyncSessionLocal() as db:
+            try:
+                ids = await entity.write(db, [row for _, row in rows])
+                await db.commit()
+                return ids
+            except Exception:
+                await db.rollback()
+                raise
+
+    # Due righe con la stessa chiave nello stesso INSERT restituirebbero lo stesso ID due volte
+    rows, covers = last_per_key(chunk, entity.key)
+    written: List[Tuple[int, Dict]] = []
+    try:
+        written = list(zip(await write(rows), (row for _, row in rows)))
+        summary.imported += len(chunk)
+    except Exception as e:
+        logger.warning(f"Bulk import chunk of {len(rows)} rows failed, retrying row by row: {str(e)}")
+        for row_number, row in rows:
+            try:
+                written.extend(zip(await write([(row_number, row)]), [row]))
+                summary.imported += covers[row_number]
+            except Exception as row_error:
+                summary.error(row_number, f"Errore del database: {row_error}")
+                summary.failed += covers[row_number] - 1
+    if entity.reindex is not None and written:
+        await entity.reindex(written)
+
+async def import_records(entity_name: str, chunks: AsyncIterator[bytes], fmt: str) -> Dict:
+    """
+    Stream, validate and upsert records chunk by chunk; returns counts and per-row errors
+    """
+    entity = ENTITIES[entity_name]
+    summary = ImportSummary(entity_name)
+    chunk: List[Tuple[int, Dict]] = []
+    records = iter_records(iter_lines(chunks), fmt, entity.list_fields, entity.json_fields)
+    async for row_number, record in records:
+        summary.processed += 1
+        if isinstance(record, str):
+            summary.error(row_number, record)
+            continue
+        try:
+            chunk.append((row_number, entity.to_row(record)))
+        except ValidationError as e:
+            summary.error(row_number, _validation_message(e))
+            continue
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await _write_chunk(entity, chunk, summary)
+            chunk = []
+    if chunk:
+        await _write_chunk(entity, chunk, summary)
+    logger.info(
+        f"Bulk import of {entity_name}: {summary.processed} rows, {summary.imported} imported, {summary.failed} failed"
+    )
+    return summary.to_dict()
+
+async def export_records(entity_name: str, fmt: str) -> AsyncIterator[bytes]:
+    """
+    Yield the table page by page (keyset on id), one short-lived session per page
+    """
+    entity = ENTITIES[entity_name]
+    columns = [getattr(entity.model, field) for field in entity.export_fields]
+    if fmt == "csv":
+        yield csv_header(entity.export_fields)
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(*columns).where(entity.model.id > last_id).order_by(entity.model.id).limit(EXPORT_PAGE_SIZE)
+            )).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        records = []
+        for row in rows:
+            record = dict(zip(entity.export_fields, row))
+            for field in entity.list_fields + entity.json_fields:
+                record[field] = decode_json_list(record[field])
+            records.append(record)
+        yield encode_rows(records, fmt, entity.export_fields)
+
+@router.post("/{entity}/import")
+async def bulk_import(
+    entity: str,
+    request: Request,
+    format: str = "ndjson",
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Import NDJSON or CSV rows streamed in the request body. Freelancers and
+    companies are upserted by email, projects by id (created when missing).
+    Returns the counts and the per-row errors.
+    """
+    _get_entity(entity, format)
+    _check_token(token)
+    return await import_records(entity, request.stream(), format)
+
+@router.get("/{entity}/export")
+async def bulk_export(
+    entity: str,
+    format: str = "ndjson",
+    token: str = Depends(oauth2_scheme)
+):
+    """
+    Stream the whole table as NDJSON or CSV, reading it one page at a time
+    """
+    _get_entity(entity, format)
+    _check_token(token)
+    return StreamingResponse(
+        export_records(entity, format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{entity}.{format}"'}
+    )
@@ -1,11 +1,19 @@
 # routers/companies.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel
-from typing import List
-from database import SessionLocal, CompanyModel
+from typing import List, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, CompanyModel
+from pagination import keyset_page
+from change_versions import etag_matches, make_etag, not_modified, query_key, set_etag, table_version
+from serialization import fast_json_response, parse_fields, rows_to_dicts
 
 router = APIRouter(prefix="/api/companies", tags=["companies"])
 
+# La password non fa parte dei campi pubblici
+COMPANY_FIELDS = ("id", "email", "user_type", "name", "description", "industry", "size", "location")
+
 class Company(BaseModel):
     name: str
     description: str
@@ -14,20 +22,27 @@ class Company(BaseModel):
     location: str
 
 @router.post("/")
-async def create_company(company: Company):
-    db = SessionLocal()
-    try:
-        db_company = CompanyModel(**company.dict())
-        db.add(db_company)
-        db.commit()
-        return company
-    finally:
-        db.close()
+async def create_company(company: Company, db: AsyncSession = Depends(get_async_db)):
+    db_company = CompanyModel(**company.dict())
+    db.add(db_company)
+    await db.commit()
+    return company
 
 @router.get("/")
-async def get_companies():
-    db = SessionLocal()
-    try:
-        return db.query(CompanyModel).all()
-    finally:
-        db.close()
\ No newline at end of file
+async def get_companies(
+    request: Request,
+    response: Response,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Paginazione per ID solo se è indicato `limit`: cursore `after`, pagina successiva nell'header X-Next-Cursor
+    selected = parse_fields(fields, COMPANY_FIELDS)
+    etag = make_etag("companies", await table_version(db, "companies"), query_key(request))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    query = select(CompanyModel.id, *(getattr(CompanyModel, field) for field in selected))
+    rows = await keyset_page(db, query, CompanyModel.id, after, limit, response, scalars=False)
+    return fast_json_response(rows_to_dicts((row[1:] for row in rows), selected), response)
\ No newline at end of file
@@ -1,11 +1,23 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
 from maigenai_matching import MaigenAIMatchingSystem
+from llm_cache import llm_cache
+from singleflight import llm_singleflight
+from prescoring import prescorer
+from match_jobs import MatchJobQueue
+from match_materializer import MatchMaterializer
+from match_history import match_history, matched_skills
+from database import SessionLocal, FreelancerModel
+import asyncio
+import json
+import logging
 import os
 
 router = APIRouter(prefix="/api/matching", tags=["matching"])
+logger = logging.getLogger(__name__)
 
 class ProjectRequirement(BaseModel):
     title: str
@@ -23,29 +35,43 @@ class MatchingResult(BaseModel):
 
 matching_system = MaigenAIMatchingSystem(openai_api_key=os.getenv("OPENAI_API_KEY"))
 
-@router.post("/find-matches", response_model=MatchingResult)
-async def find_matches(freelancer_id: str, project: ProjectRequirement):
+def load_freelancer_profiles(freelancer_ids: List[int]) -> List[dict]:
+    """
+    Carica i profili dei freelancer dal database mantenendo l'ordine degli ID
+    """
+    if not freelancer_ids:
+        return []
+    db = SessionLocal()
     try:
-        # Qui dovresti recuperare il profilo del freelancer dal database
-        # Per ora usiamo un profilo di esempio
-        freelancer_profile = {
-            "id": freelancer_id,
-            "skills": ["prompt engineering", "llm development", "python"],
-            "experience": "3 years in GenAI development",
-            "portfolio": [
-                {
-                    "title": "Custom ChatGPT Integration",
-                    "description": "Developed enterprise chatbot",
-                    "technologies": ["OpenAI API", "Python", "FastAPI"]
-                }
-            ]
+        rows = db.query(FreelancerModel).filter(FreelancerModel.id.in_(freelancer_ids)).all()
+    finally:
+        db.close()
+    by_id = {
+        row.id: {
+            "id": str(row.id),
+            "skills": row.skills or [],
+            "experience": row.experience or "",
+            "portfolio": row.portfolio or []
         }
+        for row in rows
+    }
+    return [by_id[freelancer_id] for freelancer_id in freelancer_ids if freelancer_id in by_id]
 
+@router.post("/find-matches", response_model=MatchingResult)
+async def find_matches(freelancer_id: str, project: ProjectRequirement):
+    profiles = []
+    if freelancer_id.isdigit():
+        profiles = await asyncio.to_thread(load_freelancer_profiles, [int(freelancer_id)])
+    if not profiles:
+        raise HTTPException(status_code=404, detail="Freelancer not found")
+    freelancer_profile = profiles[0]
+    try:
         # Esegui il matching usando CrewAI
         match_result = await matching_system.execute_matching(
             freelancer_profile=freelancer_profile,
             project=project.dict()
         )
+        await record_history(project, "find_matches", [(freelancer_profile, match_result["match_score"])])
 
         return MatchingResult(
             match_score=match_result["match_score"],
@@ -61,68 +87,230 @@ async def find_matches(freelancer_id: str, project: ProjectRequirement):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/batch-match")
-async def batch_match(project: ProjectRequirement, min_score: float = 0.7):
+async def prescore_candidates(project: ProjectRequirement, max_candidates: int):
+    """
+    Pre-scoring deterministico su tutti i freelancer, restituisce i top-k con i loro profili
+    """
+    prescored = prescorer.score(project.dict(), k=max_candidates)
+    prescores = {p["freelancer_id"]: p for p in prescored}
+    return prescores, await asyncio.to_thread(load_freelancer_profiles, list(prescores))
+
+def build_match(freelancer: dict, match_result: dict, prescore: dict) -> dict:
+    # Se GPT-4 non ha restituito un punteggio usiamo il pre-score deterministico
+    match_score = prescore["prescore"] if match_result.get("fallback") else match_result["match_score"]
+    return {
+        "freelancer_id": freelancer["id"],
+        "match_score": match_score,
+        "prescore": prescore["prescore"],
+        "signals": prescore["signals"],
+        "analysis": match_result["analysis"]
+    }
+
+async def record_history(project: ProjectRequirement, source: str, scored: List[tuple]) -> None:
+    """
+    Salva nello storico le coppie (freelancer, punteggio) prodotte, in un thread;
+    un errore qui non deve far fallire il matching
+    """
     try:
-        # Qui dovresti recuperare tutti i freelancer dal database
-        # Per ora usiamo una lista di esempio
-        freelancers = [
-            {
-                "id": "1",
-                "skills": ["prompt engineering", "llm development"],
-                "experience": "2 years in GenAI"
-            },
+        await asyncio.to_thread(match_history.record, [
             {
-                "id": "2",
-                "skills": ["python", "machine learning", "llm development"],
-                "experience": "4 years in AI/ML"
+                "freelancer_id": freelancer["id"],
+                "match_score": match_score,
+                "matched_skills": matched_skills(freelancer.get("skills"), project.required_skills)
             }
-        ]
+            for freelancer, match_score in scored
+            if str(freelancer["id"]).isdigit()
+        ], source=source, project_title=project.title)
+    except Exception as e:
+        logger.error(f"Errore nel salvataggio dello storico match: {str(e)}")
+
+def sort_matches(matches: List[dict]) -> List[dict]:
+    return sorted(matches, key=lambda x: (x["match_score"], x["prescore"]), reverse=True)
+
+@router.post("/batch-match")
+async def batch_match(
+    project: ProjectRequirement,
+    min_score: float = 0.7,
+    max_candidates: int = 20,
+    multi_candidate: bool = False
+):
+    try:
+        # GPT-4 solo sui top-k del pre-scoring
+        prescores, freelancers = await prescore_candidates(project, max_candidates)
+
+        # Il progetto viene analizzato una sola volta, i profili in parallelo
+        match_results = await matching_system.execute_batch_matching(
+            freelancer_profiles=freelancers,
+            project=project.dict(),
+            multi_candidate=multi_candidate
+        )
 
         matches = []
-        for freelancer in freelancers:
-            match_result = await matching_system.execute_matching(
-                freelancer_profile=freelancer,
-                project=project.dict()
-            )
-            
-            if match_result["match_score"] >= min_score:
-                matches.append({
-                    "freelancer_id": freelancer["id"],
-                    "match_score": match_result["match_score"],
-                    "analysis": match_result["analysis"]
-                })
+        scored = []
+        for freelancer, match_result in zip(freelancers, match_results):
+            match = build_match(freelancer, match_result, prescores[int(freelancer["id"])])
+            scored.append((freelancer, match["match_score"]))
+            if match["match_score"] >= min_score:
+                matches.append(match)
+        await record_history(project, "batch_match", scored)
 
         return {
             "total_matches": len(matches),
-            "matches": sorted(matches, key=lambda x: x["match_score"], reverse=True)
+            "matches": sort_matches(matches)
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/match-stats/{freelancer_id}")
-async def get_match_stats(freelancer_id: str):
+@router.post("/batch-match/stream")
+async def batch_match_stream(
+    project: ProjectRequirement,
+    min_score: float = 0.7,
+    max_candidates: int = 20,
+    format: str = "ndjson",
+    multi_candidate: bool = False
+):
+    """
+    Variante in streaming di batch-match: emette i candidati pre-scorati subito,
+    il punteggio provvisorio di ogni coppia appena GPT-4 lo produce, poi ogni
+    match completo e infine il riepilogo ordinato.
+    Formati supportati: "ndjson" (application/x-ndjson) e "sse" (text/event-stream).
+    Con multi_candidate=true più freelancer vengono valutati in una sola chiamata.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format deve essere 'ndjson' o 'sse'")
+
     try:
-        # Qui dovresti recuperare le statistiche dal database
-        # Per ora restituiamo dati di esempio
-        return {
-            "total_matches": 15,
-            "successful_matches": 12,
-            "average_score": 8.5,
-            "top_matching_skills": [
-                "prompt engineering",
-                "llm development",
-                "python"
-            ],
-            "recent_matches": [
-                {
-                    "project_id": "1",
-                    "match_score": 9.2,
-                    "date": datetime.now().isoformat()
-                }
-            ]
-        }
+        prescores, freelancers = await prescore_candidates(project, max_candidates)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def encode(event: str, payload: dict) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        return json.dumps({"type": event, **payload}) + "\n"
 
+    async def events():
+        yield encode("candidates", {"candidates": [prescores[int(f["id"])] for f in freelancers]})
+
+        # I punteggi provvisori (appena GPT-4 li emette) e i match completi confluiscono in una coda
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def on_score(index: int, score: float) -> None:
+            queue.put_nowait(("score", index, score))
+
+        async def run_matching():
+            try:
+                async for index, match_result in matching_system.iter_batch_matching(
+                    freelancer_profiles=freelancers,
+                    project=project.dict(),
+                    on_score=on_score,
+                    multi_candidate=multi_candidate
+                ):
+                    queue.put_nowait(("match", index, match_result))
+            except Exception as e:
+                queue.put_nowait(("error", None, e))
+            finally:
+                queue.put_nowait(("done", None, None))
+
+        matches = []
+        scored = []
+        task = asyncio.create_task(run_matching())
+        try:
+            while True:
+                kind, index, payload = await queue.get()
+                if kind == "done":
+                    break
+                if kind == "error":
+                    yield encode("error", {"detail": str(payload)})
+                    return
+                freelancer = freelancers[index]
+                if kind == "score":
+                    yield encode("score", {"freelancer_id": freelancer["id"], "match_score": payload})
+                    continue
+                match = build_match(freelancer, payload, prescores[int(freelancer["id"])])
+                scored.append((freelancer, match["match_score"]))
+                if match["match_score"] >= min_score:
+                    matches.append(match)
+                    yield encode("match", match)
+        finally:
+            task.cancel()
+            # Anche se il client si disconnette, salviamo i match già prodotti:
+            # shield fa completare il salvataggio anche se lo stream viene cancellato
+            await asyncio.shield(record_history(project, "batch_match", scored))
+        yield encode("summary", {"total_matches": len(matches), "matches": sort_matches(matches)})
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+match_jobs = MatchJobQueue(
+    matching_system,
+    load_profiles=load_freelancer_profiles,
+    build_match=build_match
+)
+
+match_materializer = MatchMaterializer(
+    matching_system,
+    load_profiles=load_freelancer_profiles,
+    build_match=build_match
+)
+
+@router.get("/projects/{project_id}/top")
+async def get_project_top_matches(project_id: int):
+    """
+    Migliori freelancer per un progetto dalla tabella materializzata `matches`
+    """
+    try:
+        return await match_materializer.get_top_matches(project_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/jobs", status_code=202)
+async def submit_match_job(project: ProjectRequirement, min_score: float = 0.7, max_candidates: int = 200):
+    """
+    Avvia un matching in background e restituisce subito l'ID del job
+    """
+    try:
+        prescored = prescorer.score(project.dict(), k=max_candidates)
+        job_id = await match_jobs.submit(project.dict(), prescored, min_score=min_score)
+        return {"job_id": job_id, "status": "queued", "total": len(prescored)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_match_job(job_id: str):
+    job = await match_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return job
+
+@router.get("/jobs/{job_id}/results")
+async def get_match_job_results(job_id: str, offset: int = 0, limit: int = 50):
+    job = await match_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    limit = max(1, min(limit, 200))
+    return {
+        **job,
+        "offset": offset,
+        "limit": limit,
+        "matches": await match_jobs.get_results(job_id, offset=max(offset, 0), limit=limit)
+    }
+
+@router.get("/match-stats/{freelancer_id}")
+async def get_match_stats(freelancer_id: int):
+    """
+    Statistiche di matching del freelancer, lette dai rollup pre-aggregati
+    """
+    try:
+        return await asyncio.to_thread(match_history.get_stats, freelancer_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache-stats")
+async def get_cache_stats():
+    return {**llm_cache.stats(), "singleflight": llm_singleflight.stats()}
+
+@router.get("/llm-stats")
+async def get_llm_stats():
+    return matching_system.gateway.stats()
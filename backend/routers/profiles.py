@@ -1,11 +1,23 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import os
 import jwt
 import json
 from fastapi.security import OAuth2PasswordBearer
-from database import SessionLocal, FreelancerModel, CompanyModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, FreelancerModel, CompanyModel, FreelancerSkillModel
+from skill_index import skill_index
+from vector_index import freelancer_index, freelancer_text
+from prescoring import prescorer
+from skills_store import set_freelancer_skills, skill_overlap, ids_with_skills_query
+from pagination import keyset_page, offset_page, MAX_PAGE_SIZE, MAX_SEARCH_OFFSET
+from search_index import search_freelancers
+from change_versions import etag_matches, make_etag, not_modified, query_key, set_etag, table_version
+from serialization import dumps, fast_json_response, json_bytes_response, parse_fields, rows_to_dicts, decode_json_list
+from profile_cache import profile_cache
+from routers.matching import match_materializer
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -83,6 +95,9 @@ class Freelancer(BaseModel):
             "availability": self.availability
         }
 
+FREELANCER_FIELDS = ("email", "experience", "skills", "portfolio", "user_type", "hourly_rate", "availability")
+FREELANCER_DEFAULTS = {"experience": "", "skills": [], "portfolio": []}
+
 class UserProfile(BaseModel):
     email: str
     user_type: str
@@ -102,9 +117,16 @@ class UserProfile(BaseModel):
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 @router.get("/me", response_model=UserProfile)
-async def get_me(token: str = Depends(oauth2_scheme)):
+async def get_me(
+    request: Request,
+    response: Response,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Recupera il profilo dell'utente corrente basato sul token JWT
+    Recupera il profilo dell'utente corrente basato sul token JWT.
+    L'ETag dipende dalla versione della riga: se non è cambiata risponde 304.
+    Il profilo serializzato resta in profile_cache fino alla prossima modifica.
     """
     try:
         logger.debug("Tentativo di recupero profilo utente")
@@ -119,54 +141,70 @@ async def get_me(token: str = Depends(oauth2_scheme)):
             raise HTTPException(status_code=401, detail="Token invalido o scaduto")
         
         logger.debug(f"Utente autenticato: {email}, tipo: {user_type}")
+
+        # Percorso veloce: nessuna query, risposta già serializzata
+        cached = profile_cache.get(user_type, email)
+        if cached is not None:
+            etag, body = cached
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            set_etag(response, etag)
+            return json_bytes_response(body, response)
+
+        # Presa prima della lettura: se nel frattempo il profilo viene modificato non lo mettiamo in cache
+        generation = profile_cache.generation(user_type, email)
         
         # Recupera i dati basati sul tipo di utente
-        db = SessionLocal()
-        try:
-            if user_type == "Freelancer":
-                user = db.query(FreelancerModel).filter(FreelancerModel.email == email).first()
-                if not user:
-                    logger.warning(f"Freelancer non trovato: {email}")
-                    raise HTTPException(status_code=404, detail="Utente non trovato")
-                
-                # Costruisci un profilo completo per il freelancer
-                freelancer = Freelancer.from_db(user)
-                profile = UserProfile(
-                    email=freelancer.email,
-                    user_type=freelancer.user_type,
-                    experience=freelancer.experience,
-                    skills=freelancer.skills,
-                    portfolio=freelancer.portfolio,
-                    hourly_rate=freelancer.hourly_rate,
-                    availability=freelancer.availability
-                )
-                
-            elif user_type == "Company":
-                company = db.query(CompanyModel).filter(CompanyModel.email == email).first()
-                if not company:
-                    logger.warning(f"Azienda non trovata: {email}")
-                    raise HTTPException(status_code=404, detail="Azienda non trovata")
-                
-                # Costruisci un profilo completo per l'azienda
-                profile = UserProfile(
-                    email=company.email,
-                    user_type=company.user_type,
-                    name=company.name or "",
-                    description=company.description or "",
-                    industry=company.industry or "",
-                    size=company.size or "",
-                    location=company.location or ""
-                )
-                
-            else:
-                logger.error(f"Tipo utente non valido: {user_type}")
-                raise HTTPException(status_code=400, detail="Tipo utente non valido")
+        if user_type == "Freelancer":
+            user = await db.scalar(select(FreelancerModel).where(FreelancerModel.email == email))
+            if not user:
+                logger.warning(f"Freelancer non trovato: {email}")
+                raise HTTPException(status_code=404, detail="Utente non trovato")
+            etag = make_etag("me", user_type, user.id, user.version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
             
-            logger.debug(f"Profilo recuperato con successo")
-            return profile
+            # Costruisci un profilo completo per il freelancer
+            freelancer = Freelancer.from_db(user)
+            profile = UserProfile(
+                email=freelancer.email,
+                user_type=freelancer.user_type,
+                experience=freelancer.experience,
+                skills=freelancer.skills,
+                portfolio=freelancer.portfolio,
+                hourly_rate=freelancer.hourly_rate,
+                availability=freelancer.availability
+            )
+            
+        elif user_type == "Company":
+            company = await db.scalar(select(CompanyModel).where(CompanyModel.email == email))
+            if not company:
+                logger.warning(f"Azienda non trovata: {email}")
+                raise HTTPException(status_code=404, detail="Azienda non trovata")
+            etag = make_etag("me", user_type, company.id, company.version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
             
-        finally:
-            db.close()
+            # Costruisci un profilo completo per l'azienda
+            profile = UserProfile(
+                email=company.email,
+                user_type=company.user_type,
+                name=company.name or "",
+                description=company.description or "",
+                industry=company.industry or "",
+                size=company.size or "",
+                location=company.location or ""
+            )
+            
+        else:
+            logger.error(f"Tipo utente non valido: {user_type}")
+            raise HTTPException(status_code=400, detail="Tipo utente non valido")
+        
+        logger.debug(f"Profilo recuperato con successo")
+        body = dumps(profile.dict())
+        profile_cache.set(user_type, email, etag, body, generation=generation)
+        set_etag(response, etag)
+        return json_bytes_response(body, response)
             
     except jwt.PyJWTError as e:
         logger.error(f"Errore JWT: {str(e)}")
@@ -176,27 +214,56 @@ async def get_me(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=500, detail=f"Errore interno: {str(e)}")
 
 @router.get("/", response_model=List[Freelancer])
-async def get_freelancers(token: str = Depends(oauth2_scheme)):
+async def get_freelancers(
+    request: Request,
+    response: Response,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    skills: Optional[List[str]] = Query(None),
+    min_rate: Optional[float] = None,
+    max_rate: Optional[float] = None,
+    fields: Optional[str] = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Recupera tutti i profili dei freelancer
+    Recupera i profili dei freelancer, filtrati per skill (tutte richieste) e tariffa oraria.
+    `fields=email,skills` restituisce solo i campi indicati.
+    Con `limit` la lista è paginata (cursore `after` sull'ID, header X-Next-Cursor),
+    senza restituisce tutti i profili.
     """
+    selected = parse_fields(fields, FREELANCER_FIELDS)
     try:
-        db = SessionLocal()
-        freelancers = db.query(FreelancerModel).all()
-        
-        result = []
-        for f in freelancers:
-            result.append(Freelancer.from_db(f))
-        
-        return result
+        etag = make_etag("freelancers", await table_version(db, "freelancers"), query_key(request))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        # Solo le colonne richieste, serializzate direttamente senza passare da Pydantic
+        query = select(FreelancerModel.id, *(getattr(FreelancerModel, field) for field in selected))
+        if skills:
+            query = query.where(FreelancerModel.id.in_(
+                ids_with_skills_query(FreelancerSkillModel, "freelancer_id", skills, match_all=True)
+            ))
+        if min_rate is not None:
+            query = query.where(FreelancerModel.hourly_rate >= min_rate)
+        if max_rate is not None:
+            query = query.where(FreelancerModel.hourly_rate <= max_rate)
+        rows = await keyset_page(db, query, FreelancerModel.id, after, limit, response, scalars=False)
+        result = rows_to_dicts((row[1:] for row in rows), selected, FREELANCER_DEFAULTS)
+        if "portfolio" in selected:
+            for item in result:
+                item["portfolio"] = decode_json_list(item["portfolio"])
+        return fast_json_response(result, response)
     except Exception as e:
         logger.error(f"Errore nel recupero dei freelancer: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @router.post("/", response_model=Freelancer)
-async def create_profile(profile: Freelancer, token: str = Depends(oauth2_scheme)):
+async def create_profile(
+    profile: Freelancer,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Crea o aggiorna un profilo freelancer
     """
@@ -210,9 +277,8 @@ async def create_profile(profile: Freelancer, token: str = Depends(oauth2_scheme
         profile_dict = profile.to_db_dict()
         logger.debug(f"Dati profilo convertiti per DB: {profile_dict}")
         
-        db = SessionLocal()
         try:
-            existing_profile = db.query(FreelancerModel).filter(FreelancerModel.email == profile.email).first()
+            existing_profile = await db.scalar(select(FreelancerModel).where(FreelancerModel.email == profile.email))
             
             if existing_profile:
                 # Aggiorna profilo esistente
@@ -236,17 +302,87 @@ async def create_profile(profile: Freelancer, token: str = Depends(oauth2_scheme
                 )
                 db.add(new_profile)
             
-            db.commit()
+            # Dual-write delle skill nella tabella normalizzata, nella stessa transazione
+            saved_profile = existing_profile or new_profile
+            await db.flush()
+            await set_freelancer_skills(db, saved_profile.id, profile_dict["skills"])
+            await db.commit()
+            profile_cache.invalidate("Freelancer", [profile.email])
+            skill_index.update(saved_profile.id, profile_dict["skills"])
+            await freelancer_index.upsert(saved_profile.id, freelancer_text(
+                profile_dict["skills"], profile_dict["experience"], profile_dict["portfolio"]
+            ))
+            prescorer.update(
+                saved_profile.id, profile_dict["hourly_rate"], profile_dict["availability"], profile_dict["experience"]
+            )
+            await match_materializer.mark_freelancer_dirty(
+                saved_profile.id, profile_dict["skills"], profile_dict["experience"], profile_dict["portfolio"]
+            )
             logger.info(f"Profilo salvato con successo: {profile.email}")
             return profile
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Errore durante il salvataggio nel DB: {str(e)}")
             raise
-        finally:
-            db.close()
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token invalido")
     except Exception as e:
         logger.error(f"Errore nella creazione del profilo: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+class SkillOverlap(BaseModel):
+    email: str
+    matched_skills: int
+
+@router.get("/skill-overlap", response_model=List[SkillOverlap])
+async def get_skill_overlap(
+    skills: List[str] = Query(...),
+    limit: int = 20,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Freelancer ordinati per numero di skill in comune, tramite join indicizzate su freelancer_skills
+    """
+    try:
+        overlap = await skill_overlap(db, skills, limit=max(1, min(limit, 200)))
+        emails = dict((await db.execute(
+            select(FreelancerModel.id, FreelancerModel.email).where(
+                FreelancerModel.id.in_([freelancer_id for freelancer_id, _ in overlap])
+            )
+        )).all())
+        return [
+            SkillOverlap(email=emails[freelancer_id], matched_skills=matched)
+            for freelancer_id, matched in overlap
+            if freelancer_id in emails
+        ]
+    except Exception as e:
+        logger.error(f"Errore nella ricerca per skill: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+class FreelancerSearchResult(BaseModel):
+    id: int
+    email: str
+    snippet: str
+    score: float
+
+@router.get("/search", response_model=List[FreelancerSearchResult])
+async def search_profiles(
+    response: Response,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ricerca full-text (FTS5, ranking BM25) su esperienza, skill e portfolio dei freelancer
+    """
+    try:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, min(offset, MAX_SEARCH_OFFSET))
+        results = await search_freelancers(db, q, limit + 1, offset)
+        return offset_page(results, limit, offset, response)
+    except Exception as e:
+        logger.error(f"Errore nella ricerca dei freelancer: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
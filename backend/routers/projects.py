@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import os
 import jwt
 from fastapi.security import OAuth2PasswordBearer
-from database import SessionLocal, ProjectModel, CompanyModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, ProjectModel, CompanyModel, ProjectSkillModel
+from vector_index import project_index, project_text
+from skill_index import project_skill_index
+from skills_store import set_project_skills, ids_with_skills_query
+from pagination import keyset_page, offset_page, MAX_PAGE_SIZE, MAX_SEARCH_OFFSET
+from search_index import search_projects as search_projects_index
+from change_versions import etag_matches, make_etag, not_modified, query_key, set_etag, table_version
+from serialization import fast_json_response, parse_fields, rows_to_dicts
+from routers.matching import match_materializer
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
@@ -12,6 +22,17 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
+class SimilarProject(BaseModel):
+    id: int
+    title: str
+    similarity: float
+
+class ProjectSearchResult(BaseModel):
+    id: int
+    title: str
+    snippet: str
+    score: float
+
 class Project(BaseModel):
     title: str
     description: str
@@ -21,49 +42,69 @@ class Project(BaseModel):
     company_email: Optional[str] = None
     freelancer_email: Optional[str] = None
 
+PROJECT_FIELDS = (
+    "title", "description", "budget", "timeline", "required_skills", "company_email", "freelancer_email"
+)
+PROJECT_DEFAULTS = {"required_skills": []}
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 @router.get("/", response_model=List[Project])
-async def get_projects(token: str = Depends(oauth2_scheme)):
-    db = SessionLocal()
+async def get_projects(
+    request: Request,
+    response: Response,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+    skills: Optional[List[str]] = Query(None),
+    min_budget: Optional[float] = None,
+    max_budget: Optional[float] = None,
+    company_email: Optional[str] = None,
+    assigned: Optional[bool] = None,
+    fields: Optional[str] = None,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Progetti filtrati su skill richieste, budget, azienda e assegnazione a un freelancer.
+    Con `limit` la lista è paginata per ID (cursore `after`, header X-Next-Cursor).
+    `fields=title,budget` restituisce solo i campi indicati.
+    """
+    selected = parse_fields(fields, PROJECT_FIELDS)
     try:
-        projects = db.query(ProjectModel).all()
-        result = []
-        
-        for project in projects:
-            # Verifica se gli attributi esistono nel modello prima di tentare di accedervi
-            project_dict = {
-                "title": project.title,
-                "description": project.description,
-                "budget": project.budget,
-                "timeline": project.timeline,
-                "required_skills": project.required_skills
-            }
-            
-            # Aggiungi company_email e freelancer_email solo se esistono nel modello
-            if hasattr(project, 'company_email'):
-                project_dict["company_email"] = project.company_email
-            else:
-                project_dict["company_email"] = None
-                
-            if hasattr(project, 'freelancer_email'):
-                project_dict["freelancer_email"] = project.freelancer_email
-            else:
-                project_dict["freelancer_email"] = None
-                
-            result.append(Project(**project_dict))
-            
+        etag = make_etag("projects", await table_version(db, "projects"), query_key(request))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        # Solo le colonne richieste, serializzate direttamente senza passare da Pydantic
+        query = select(ProjectModel.id, *(getattr(ProjectModel, field) for field in selected))
+        if skills:
+            query = query.where(ProjectModel.id.in_(
+                ids_with_skills_query(ProjectSkillModel, "project_id", skills, match_all=True)
+            ))
+        if min_budget is not None:
+            query = query.where(ProjectModel.budget >= min_budget)
+        if max_budget is not None:
+            query = query.where(ProjectModel.budget <= max_budget)
+        if company_email is not None:
+            query = query.where(ProjectModel.company_email == company_email)
+        if assigned is not None:
+            query = query.where(
+                ProjectModel.freelancer_email.isnot(None) if assigned else ProjectModel.freelancer_email.is_(None)
+            )
+        rows = await keyset_page(db, query, ProjectModel.id, after, limit, response, scalars=False)
+        result = rows_to_dicts((row[1:] for row in rows), selected, PROJECT_DEFAULTS)
         logger.debug(f"Retrieved projects: {len(result)}")
-        return result
+        return fast_json_response(result, response)
     except Exception as e:
         logger.error(f"Error fetching projects: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        db.close()
 
 @router.post("/", response_model=Project)
-async def create_project(project: Project, token: str = Depends(oauth2_scheme)):
-    db = SessionLocal()
+async def create_project(
+    project: Project,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
         logger.debug(f"Creating project with data: {project.dict()}")
         payload = jwt.decode(token, os.getenv("JWT_SECRET"), algorithms=["HS256"])
@@ -72,7 +113,7 @@ async def create_project(project: Project, token: str = Depends(oauth2_scheme)):
 
         # Verifica se company_email esiste (opzionale se None)
         if project.company_email:
-            company = db.query(CompanyModel).filter(CompanyModel.email == project.company_email).first()
+            company = await db.scalar(select(CompanyModel).where(CompanyModel.email == project.company_email))
             if not company:
                 raise HTTPException(status_code=404, detail="Company not found")
 
@@ -96,8 +137,14 @@ async def create_project(project: Project, token: str = Depends(oauth2_scheme)):
         
         db_project = ProjectModel(**project_data)
         db.add(db_project)
-        db.commit()
-        db.refresh(db_project)
+        # Dual-write delle skill richieste nella tabella normalizzata, nella stessa transazione
+        await db.flush()
+        await set_project_skills(db, db_project.id, project.required_skills)
+        await db.commit()
+        await db.refresh(db_project)
+        await project_index.upsert(db_project.id, project_text(project.title, project.description, project.required_skills))
+        project_skill_index.update(db_project.id, project.required_skills)
+        await match_materializer.mark_projects_dirty([db_project.id])
         logger.info(f"Project created successfully: {db_project.title}")
         return project
     except jwt.InvalidTokenError:
@@ -105,7 +152,54 @@ async def create_project(project: Project, token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token")
     except Exception as e:
         logger.error(f"Error creating project: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
\ No newline at end of file
+
+@router.get("/search", response_model=List[ProjectSearchResult])
+async def search_projects(
+    response: Response,
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Full-text search (FTS5, BM25 ranking) over project title, description and required skills
+    """
+    try:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, min(offset, MAX_SEARCH_OFFSET))
+        results = await search_projects_index(db, q, limit + 1, offset)
+        return offset_page(results, limit, offset, response)
+    except Exception as e:
+        logger.error(f"Error searching projects: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@router.get("/{project_id}/similar", response_model=List[SimilarProject])
+async def get_similar_projects(
+    project_id: int,
+    k: int = 5,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    vector = project_index.vector_for(project_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    neighbours = project_index.search_vector(vector, k=k, exclude=[project_id])
+    try:
+        rows = (await db.execute(
+            select(ProjectModel.id, ProjectModel.title).where(
+                ProjectModel.id.in_([project_id for project_id, _ in neighbours])
+            )
+        )).all()
+        titles = {row.id: row.title for row in rows}
+        return [
+            SimilarProject(id=neighbour_id, title=titles[neighbour_id] or "", similarity=round(similarity, 4))
+            for neighbour_id, similarity in neighbours
+            if neighbour_id in titles
+        ]
+    except Exception as e:
+        logger.error(f"Error fetching similar projects: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
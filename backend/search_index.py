@@ -0,0 +1,130 @@
+from typing import Dict, List, Optional
+import re
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Tabelle FTS5 con rowid = ID della riga sorgente, sincronizzate da trigger:
+# qualunque percorso di scrittura (router, import, migrazioni) aggiorna l'indice
+FTS_TOKENIZER = "porter unicode61 remove_diacritics 2"
+# Indici dei prefissi brevi: la ricerca mentre si digita non espande centinaia di termini
+FTS_PREFIXES = "2 3"
+
+# Testo del portfolio: titolo, descrizione e tecnologie di ogni elemento del JSON
+_PORTFOLIO_TEXT = """
+    CASE WHEN json_valid({row}.portfolio) THEN (
+        SELECT group_concat(
+            coalesce(json_extract(value, '$.title'), '') || ' ' ||
+            coalesce(json_extract(value, '$.description'), '') || ' ' ||
+            coalesce(json_extract(value, '$.technologies'), ''), ' ')
+        FROM json_each({row}.portfolio)
+    ) END
+"""
+_SKILLS_TEXT = "CASE WHEN json_valid({row}.{column}) THEN {row}.{column} END"
+
+FREELANCER_FTS_COLUMNS = {
+    "experience": "{row}.experience",
+    "skills": _SKILLS_TEXT.replace("{column}", "skills"),
+    "portfolio": _PORTFOLIO_TEXT,
+}
+PROJECT_FTS_COLUMNS = {
+    "title": "{row}.title",
+    "description": "{row}.description",
+    "skills": _SKILLS_TEXT.replace("{column}", "required_skills"),
+}
+FTS_TABLES = {
+    "freelancers_fts": ("freelancers", FREELANCER_FTS_COLUMNS),
+    "projects_fts": ("projects", PROJECT_FTS_COLUMNS),
+}
+# Colonne sorgente: aggiornamenti ad altre colonne (es. password) non reindicizzano la riga
+FTS_SOURCE_COLUMNS = {
+    "freelancers_fts": "experience, skills, portfolio",
+    "projects_fts": "title, description, required_skills",
+}
+
+def _insert_sql(fts_table: str, columns: Dict[str, str], row: str) -> str:
+    values = ", ".join(expression.format(row=row) for expression in columns.values())
+    return f"INSERT INTO {fts_table}(rowid, {', '.join(columns)}) VALUES ({row}.id, {values});"
+
+def create_search_tables(conn: Connection) -> None:
+    """
+    Create the FTS5 tables and their sync triggers if they do not exist
+    """
+    for fts_table, (source, columns) in FTS_TABLES.items():
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+            f"{', '.join(columns)}, tokenize='{FTS_TOKENIZER}', prefix='{FTS_PREFIXES}')"
+        )
+        delete_old = f"DELETE FROM {fts_table} WHERE rowid = OLD.id;"
+        insert_new = _insert_sql(fts_table, columns, "NEW")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source} BEGIN {insert_new} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {FTS_SOURCE_COLUMNS[fts_table]} ON {source} "
+            f"BEGIN {delete_old} {insert_new} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source} BEGIN {delete_old} END"
+        )
+
+def index_rows(conn: Connection, fts_table: str, ids: List[int]) -> None:
+    """
+    (Re)index the given source rows, used by the backfill of existing data
+    """
+    source, columns = FTS_TABLES[fts_table]
+    placeholders = ", ".join(str(int(row_id)) for row_id in ids)
+    values = ", ".join(expression.format(row=source) for expression in columns.values())
+    conn.exec_driver_sql(f"DELETE FROM {fts_table} WHERE rowid IN ({placeholders})")
+    conn.exec_driver_sql(
+        f"INSERT INTO {fts_table}(rowid, {', '.join(columns)}) "
+        f"SELECT {source}.id, {values} FROM {source} WHERE {source}.id IN ({placeholders})"
+    )
+
+def to_match_query(query: str) -> Optional[str]:
+    """
+    Turn free user text into a safe FTS5 query: every word must match,
+    the last one as a prefix so results update while typing
+    """
+    words = re.findall(r"\w+", query or "")
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+async def search_projects(db: AsyncSession, query: str, limit: int, offset: int) -> List[Dict]:
+    match = to_match_query(query)
+    if match is None:
+        return []
+    rows = await db.execute(text("""
+        SELECT projects.id, projects.title,
+               snippet(projects_fts, -1, '[', ']', '…', 12) AS snippet,
+               bm25(projects_fts, 10.0, 2.0, 5.0) AS rank
+        FROM projects_fts JOIN projects ON projects.id = projects_fts.rowid
+        WHERE projects_fts MATCH :match
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    """), {"match": match, "limit": limit, "offset": offset})
+    return [
+        {"id": row.id, "title": row.title or "", "snippet": row.snippet or "", "score": round(-row.rank, 4)}
+        for row in rows
+    ]
+
+async def search_freelancers(db: AsyncSession, query: str, limit: int, offset: int) -> List[Dict]:
+    match = to_match_query(query)
+    if match is None:
+        return []
+    rows = await db.execute(text("""
+        SELECT freelancers.id, freelancers.email,
+               snippet(freelancers_fts, -1, '[', ']', '…', 12) AS snippet,
+               bm25(freelancers_fts, 3.0, 5.0, 2.0) AS rank
+        FROM freelancers_fts JOIN freelancers ON freelancers.id = freelancers_fts.rowid
+        WHERE freelancers_fts MATCH :match
+        ORDER BY rank
+        LIMIT :limit OFFSET :offset
+    """), {"match": match, "limit": limit, "offset": offset})
+    return [
+        {"id": row.id, "email": row.email, "snippet": row.snippet or "", "score": round(-row.rank, 4)}
+        for row in rows
+    ]
@@ -0,0 +1,84 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+import json
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pagination import NEXT_CURSOR_HEADER, NEXT_OFFSET_HEADER
+
+try:
+    import orjson
+except ImportError:  # orjson è opzionale: senza, si usa il json della libreria standard
+    orjson = None
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered straight to bytes, skipping FastAPI's
+    response_model re-validation; for rows already shaped by the handler
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def _forwarded_headers(response: Response) -> Dict[str, str]:
+    return {
+        name: response.headers[name]
+        for name in (NEXT_CURSOR_HEADER, NEXT_OFFSET_HEADER, "ETag", "Cache-Control")
+        if name in response.headers
+    }
+
+def fast_json_response(content: Any, response: Response) -> FastJSONResponse:
+    """
+    FastJSONResponse carrying the pagination and caching headers set on the injected `response`
+    """
+    return FastJSONResponse(content, headers=_forwarded_headers(response))
+
+def json_bytes_response(body: bytes, response: Response) -> Response:
+    """
+    Like fast_json_response, for a body already serialized with dumps (e.g. from a cache)
+    """
+    return Response(body, media_type="application/json", headers=_forwarded_headers(response))
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """
+    Parse a `fields=a,b` sparse fieldset, defaulting to all `allowed` fields
+    """
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campi non validi: {', '.join(unknown)}. Disponibili: {', '.join(allowed)}"
+        )
+    return requested
+
+def decode_json_list(value: Any) -> list:
+    # Alcune righe storiche hanno il JSON salvato come stringa
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
+
+def rows_to_dicts(rows: Iterable, fields: Sequence[str], defaults: Optional[Dict[str, Any]] = None) -> List[Dict]:
+    """
+    Shape column rows (from a select of exactly `fields`) into plain dicts,
+    replacing NULLs with the per-field `defaults`
+    """
+    defaults = defaults or {}
+    result = []
+    for row in rows:
+        item = {}
+        for field, value in zip(fields, row):
+            if value is None and field in defaults:
+                value = defaults[field]
+            item[field] = value
+        result.append(item)
+    return result
@@ -0,0 +1,67 @@
+from typing import Awaitable, Callable, Dict, TypeVar
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into a single upstream call.
+
+    The first caller for a key starts the call; callers arriving while it
+    is in flight await the same task. Exceptions propagate to every waiter.
+    A waiter being cancelled does not cancel the shared call unless it was
+    the last one still waiting for it.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._inflight.get(key) is task and self._waiters[key] == 1 and not task.done():
+                task.cancel()
+                # Subito fuori dalla mappa: chi arriva ora avvia una nuova chiamata invece
+                # di unirsi a un task annullato (_forget girerebbe solo al prossimo ciclo)
+                del self._inflight[key]
+                del self._waiters[key]
+            raise
+        finally:
+            if self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._waiters[key]
+        # Evita il warning "exception was never retrieved" se nessuno è rimasto in attesa
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced
+        }
+
+# Condiviso da MaigenAIMatchingSystem e AIAdvisor: stesse chiavi della cache LLM
+llm_singleflight = SingleFlight()
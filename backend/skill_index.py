@@ -0,0 +1,95 @@
+from typing import Dict, Iterable, List, Set, Tuple
+import logging
+import math
+import re
+from database import SessionLocal, FreelancerModel, ProjectModel
+from serialization import decode_json_list
+
+logger = logging.getLogger(__name__)
+
+def normalize_skill(skill: str) -> str:
+    """
+    Normalize a skill name so that "LLM-Development" and "llm development" match
+    """
+    return re.sub(r"[\s_\-]+", " ", str(skill)).strip().lower()
+
+class SkillIndex:
+    """
+    In-process inverted index from normalized skill to entity IDs.
+
+    The freelancer index shortlists candidates for a project before any LLM
+    call; the project index finds the projects affected by a profile change.
+    Skills are weighted by inverse document frequency so that rare skills
+    count more than ubiquitous ones like "python".
+    """
+
+    def __init__(self, model=FreelancerModel, skills_attr: str = "skills"):
+        self.model = model
+        self.skills_attr = skills_attr
+        self._postings: Dict[str, Set[int]] = {}
+        self._skills_by_entity: Dict[int, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._skills_by_entity)
+
+    def rebuild(self) -> None:
+        """
+        Rebuild the index from all rows of the model in the database
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(self.model.id, getattr(self.model, self.skills_attr)).all()
+        finally:
+            db.close()
+
+        self._postings = {}
+        self._skills_by_entity = {}
+        for entity_id, skills in rows:
+            self.update(entity_id, decode_json_list(skills))
+        logger.info(f"Skill index on {self.model.__tablename__} built: {len(self)} rows, {len(self._postings)} skills")
+
+    def update(self, entity_id: int, skills: Iterable[str]) -> None:
+        self.remove(entity_id)
+        normalized = {normalize_skill(s) for s in skills if s and str(s).strip()}
+        self._skills_by_entity[entity_id] = normalized
+        for skill in normalized:
+            self._postings.setdefault(skill, set()).add(entity_id)
+
+    def remove(self, entity_id: int) -> None:
+        for skill in self._skills_by_entity.pop(entity_id, set()):
+            postings = self._postings.get(skill)
+            if postings is not None:
+                postings.discard(entity_id)
+                if not postings:
+                    del self._postings[skill]
+
+    def ids_with(self, skill: str) -> Set[int]:
+        return self._postings.get(normalize_skill(skill), set())
+
+    def skill_weight(self, skill: str) -> float:
+        df = len(self._postings.get(skill, ()))
+        return math.log(1 + len(self) / (1 + df)) + 1.0
+
+    def shortlist(self, required_skills: Iterable[str], limit: int = 20) -> List[Tuple[int, float]]:
+        """
+        Return up to `limit` (entity_id, score) pairs sorted by weighted
+        skill overlap, where score is the matched share of the total weight
+        of the required skills (0-1)
+        """
+        required = {normalize_skill(s) for s in required_skills if s and str(s).strip()}
+        if not required:
+            return []
+
+        weights = {skill: self.skill_weight(skill) for skill in required}
+        total_weight = sum(weights.values())
+
+        scores: Dict[int, float] = {}
+        for skill, weight in weights.items():
+            for entity_id in self._postings.get(skill, ()):
+                scores[entity_id] = scores.get(entity_id, 0.0) + weight
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [(entity_id, score / total_weight) for entity_id, score in ranked]
+
+skill_index = SkillIndex()
+project_skill_index = SkillIndex(ProjectModel, "required_skills")
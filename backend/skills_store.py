@@ -0,0 +1,101 @@
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SkillModel, FreelancerSkillModel, ProjectSkillModel
+from skill_index import normalize_skill
+
+def normalize_skills(skills: Iterable[str]) -> List[str]:
+    return sorted({normalize_skill(s) for s in skills or [] if s and str(s).strip()})
+
+async def get_or_create_skill_ids(db: AsyncSession, skills: Iterable[str]) -> Dict[str, int]:
+    """
+    Map normalized skill names to their ids in `skills`, inserting the missing ones
+    """
+    names = normalize_skills(skills)
+    if not names:
+        return {}
+    await db.execute(insert(SkillModel).values([{"name": name} for name in names]).on_conflict_do_nothing())
+    rows = await db.execute(select(SkillModel.name, SkillModel.id).where(SkillModel.name.in_(names)))
+    return dict(rows.all())
+
+async def replace_skills_bulk(
+    db: AsyncSession,
+    association,
+    owner_column: str,
+    owners: List[Tuple[int, Iterable[str]]]
+) -> None:
+    """
+    Replace the skills of several owners with one delete and one insert
+    """
+    if not owners:
+        return
+    normalized = [(owner_id, normalize_skills(skills)) for owner_id, skills in owners]
+    skill_ids = await get_or_create_skill_ids(db, [name for _, names in normalized for name in names])
+    owner = getattr(association, owner_column)
+    await db.execute(delete(association).where(owner.in_([owner_id for owner_id, _ in normalized])))
+    values = [
+        {owner_column: owner_id, "skill_id": skill_ids[name]}
+        for owner_id, names in dict(normalized).items()
+        for name in names
+    ]
+    if values:
+        await db.execute(insert(association).values(values))
+
+async def _replace_skills(db: AsyncSession, association, owner_column: str, owner_id: int, skills: Iterable[str]) -> None:
+    await replace_skills_bulk(db, association, owner_column, [(owner_id, skills)])
+
+async def set_freelancer_skills(db: AsyncSession, freelancer_id: int, skills: Iterable[str]) -> None:
+    """
+    Dual-write of FreelancerModel.skills into freelancer_skills, in the caller's transaction
+    """
+    await _replace_skills(db, FreelancerSkillModel, "freelancer_id", freelancer_id, skills)
+
+async def set_project_skills(db: AsyncSession, project_id: int, skills: Iterable[str]) -> None:
+    """
+    Dual-write of ProjectModel.required_skills into project_skills, in the caller's transaction
+    """
+    await _replace_skills(db, ProjectSkillModel, "project_id", project_id, skills)
+
+def ids_with_skills_query(association, owner_column: str, skills: Iterable[str], match_all: bool = False):
+    """
+    Subquery of owner ids having any (or, with `match_all`, every) of `skills`,
+    resolved through the (skill_id, owner_id) index
+    """
+    names = normalize_skills(skills)
+    owner = getattr(association, owner_column)
+    query = (
+        select(owner)
+        .join(SkillModel, SkillModel.id == association.skill_id)
+        .where(SkillModel.name.in_(names))
+        .group_by(owner)
+    )
+    if match_all:
+        query = query.having(func.count() == len(names))
+    return query
+
+async def skill_overlap(
+    db: AsyncSession,
+    required_skills: Iterable[str],
+    limit: int = 20,
+    association=FreelancerSkillModel,
+    owner_column: str = "freelancer_id"
+) -> List[Tuple[int, int]]:
+    """
+    (owner_id, matched skill count) pairs for the owners sharing at least one
+    of `required_skills`, best overlap first
+    """
+    names = normalize_skills(required_skills)
+    if not names:
+        return []
+    owner = getattr(association, owner_column)
+    matched = func.count().label("matched")
+    rows = await db.execute(
+        select(owner, matched)
+        .join(SkillModel, SkillModel.id == association.skill_id)
+        .where(SkillModel.name.in_(names))
+        .group_by(owner)
+        .order_by(matched.desc(), owner)
+        .limit(limit)
+    )
+    return [(owner_id, count) for owner_id, count in rows.all()]
@@ -0,0 +1,127 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import json
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a streamed JSON object.
+
+    `feed` accepts arbitrary chunks of the completion and returns the
+    top-level (key, value) pairs completed by that chunk, so callers can act
+    on early fields (e.g. the overall score) before the object is finished.
+    `close` parses and returns the whole object, raising ValueError if the
+    stream did not contain a valid JSON object.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0  # prossimo carattere da analizzare
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self.fields: Dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._text += chunk
+        completed: List[Tuple[str, Any]] = []
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._key_start = None
+                    elif self._depth == 1 and self._value_start is not None and text[self._value_start] == '"':
+                        completed.append(self._complete(text[self._value_start:i + 1]))
+                i += 1
+                continue
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = i
+                    elif self._value_start is None:
+                        self._value_start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    completed.append(self._complete(text[self._value_start:i + 1]))
+                elif self._depth == 0:
+                    self._flush_scalar(text, i, completed)
+            elif ch == "," and self._depth == 1:
+                self._flush_scalar(text, i, completed)
+            elif (
+                self._depth == 1 and self._key is not None and self._value_start is None
+                and not ch.isspace() and ch != ":"
+            ):
+                # Inizio di un valore scalare (numero, true, false, null)
+                self._value_start = i
+            i += 1
+        self._pos = i
+        return completed
+
+    def _flush_scalar(self, text: str, end: int, completed: List[Tuple[str, Any]]) -> None:
+        if self._key is not None and self._value_start is not None:
+            completed.append(self._complete(text[self._value_start:end].strip()))
+        self._key = None
+        self._value_start = None
+
+    def _complete(self, raw: str) -> Tuple[str, Any]:
+        key = self._key
+        value = json.loads(raw)
+        self.fields[key] = value
+        self._key = None
+        self._value_start = None
+        return key, value
+
+    def close(self) -> Dict[str, Any]:
+        text = self._text.strip()
+        # Alcuni modelli racchiudono il JSON in un blocco ```json
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.index("{"):] if "{" in text else text
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end == -1:
+            raise ValueError("LLM response does not contain a JSON object")
+        result = json.loads(text[start:end + 1])
+        if not isinstance(result, dict):
+            raise ValueError("LLM response is not a JSON object")
+        return result
+
+SchemaType = Union[type, Tuple[type, ...]]
+
+def validate_fields(obj: Dict[str, Any], schema: Dict[str, SchemaType]) -> Dict[str, Any]:
+    """
+    Check that every key in `schema` is present with the expected type
+    """
+    for key, expected in schema.items():
+        if key not in obj:
+            raise ValueError(f"Missing field '{key}' in LLM response")
+        value = obj[key]
+        allowed = expected if isinstance(expected, tuple) else (expected,)
+        # bool è una sottoclasse di int: va accettato solo se richiesto esplicitamente
+        if not isinstance(value, allowed) or (isinstance(value, bool) and bool not in allowed):
+            raise ValueError(f"Field '{key}' has unexpected type {type(value).__name__}")
+    return obj
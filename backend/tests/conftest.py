@@ -0,0 +1,5 @@
+import os
+import sys
+
+# I moduli del backend si importano con percorsi assoluti dalla cartella backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,52 @@
+import asyncio
+from collections import Counter
+import pytest
+
+pytest.importorskip("crewai")
+from maigenai_matching import MaigenAIMatchingSystem  # noqa: E402
+
+class FakeMatchingSystem(MaigenAIMatchingSystem):
+    """
+    No LLM: a multi-candidate call streams some scores, then fails validation
+    """
+
+    def __init__(self):
+        super().__init__("test", gateway=object())
+
+    async def analyze_project_requirements(self, project):
+        return {}
+
+    async def analyze_profile(self, freelancer_profile):
+        return {"id": freelancer_profile["id"]}
+
+    async def score_match(self, profile_analysis, project_analysis, on_score=None):
+        if on_score:
+            on_score(5.0)
+        return {"match_score": 5.0, "freelancer": profile_analysis["id"]}
+
+    async def score_candidates(self, project_analysis, freelancer_profiles, on_score=None):
+        for position in range(len(freelancer_profiles) - 1):
+            if on_score:
+                on_score(position, 9.0)
+        raise ValueError("Missing scores for candidates ['c%d']" % (len(freelancer_profiles) - 1))
+
+def test_fallback_does_not_report_a_score_twice():
+    async def scenario():
+        system = FakeMatchingSystem()
+        profiles = [{"id": str(i), "skills": [], "experience": "", "portfolio": []} for i in range(6)]
+        scores = []
+        results = [
+            index
+            async for index, _ in system.iter_batch_matching(
+                profiles, {"title": "t"}, on_score=lambda index, score: scores.append((index, score)),
+                multi_candidate=True
+            )
+        ]
+        return results, scores
+
+    results, scores = asyncio.run(scenario())
+    assert sorted(results) == list(range(6))
+    assert Counter(index for index, _ in scores) == Counter(range(6))
+    # Il punteggio annunciato in streaming resta quello del blocco; l'ultimo arriva dal fallback
+    assert dict(scores)[0] == 9.0
+    assert dict(scores)[5] == 5.0
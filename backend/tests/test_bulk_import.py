@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from bulk_io import last_per_key
+from prescoring import FreelancerPrescorer
+
+def test_last_per_key_keeps_the_last_row_per_key():
+    records = [
+        (1, {"email": "d@x.io", "experience": "old"}),
+        (2, {"email": "e@x.io"}),
+        (3, {"email": "d@x.io", "experience": "new"}),
+    ]
+    kept, covers = last_per_key(records, "email")
+    assert kept == [(2, {"email": "e@x.io"}), (3, {"email": "d@x.io", "experience": "new"})]
+    assert covers == {2: 1, 3: 2}
+
+def test_last_per_key_keeps_rows_without_key():
+    records = [(1, {"title": "a"}), (2, {"id": 7, "title": "b"}), (3, {"title": "c"}), (4, {"id": 7, "title": "d"})]
+    kept, covers = last_per_key(records, "id")
+    assert [row for row, _ in kept] == [1, 3, 4]
+    assert covers == {1: 1, 3: 1, 4: 2}
+
+def test_update_many_with_repeated_new_id():
+    prescorer = FreelancerPrescorer()
+    prescorer.update_many([
+        (1, 50.0, "full time", "2 years"),
+        (2, 40.0, "part time", "1 year"),
+        (1, 80.0, "busy", "9 years"),
+    ])
+    assert prescorer._ids.tolist() == [1, 2]
+    assert prescorer._positions == {1: 0, 2: 1}
+    assert prescorer._hourly_rate.tolist() == [80.0, 40.0]
+    assert prescorer._availability[0] == 0.0
+    assert np.isclose(prescorer._experience[0], 0.9)
+
+    prescorer.update_many([(2, None, None, None), (3, 30.0, None, None)])
+    assert prescorer._ids.tolist() == [1, 2, 3]
+    assert np.isnan(prescorer._hourly_rate[1])
+    assert prescorer._positions[3] == 2
+
+def test_bulk_requires_a_service_token():
+    pytest.importorskip("crewai")
+    from routers.auth import create_jwt_token, create_service_token
+    from routers.bulk import _check_token
+
+    _check_token(create_service_token("test"))
+    for user_type in ("Freelancer", "Company", None):
+        with pytest.raises(HTTPException) as error:
+            _check_token(create_jwt_token({"sub": "u@x.it", "user_type": user_type}))
+        assert error.value.status_code == 403
+    with pytest.raises(HTTPException) as error:
+        _check_token("not-a-token")
+    assert error.value.status_code == 401
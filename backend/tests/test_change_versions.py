@@ -0,0 +1,71 @@
+import pytest
+from fastapi import Depends, FastAPI, Request, Response
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.datastructures import Headers
+from change_versions import create_version_triggers, etag_matches, make_etag, not_modified, query_key, set_etag, table_version
+from database import Base
+
+def _request(if_none_match=None) -> Request:
+    headers = Headers({"if-none-match": if_none_match} if if_none_match is not None else {})
+    return Request({"type": "http", "method": "GET", "path": "/", "query_string": b"", "headers": headers.raw})
+
+def test_etag_matches_weak_and_list_values():
+    etag = make_etag("companies", 3)
+    assert not etag_matches(_request(), etag)
+    assert etag_matches(_request(etag), etag)
+    assert etag_matches(_request("W/" + etag), etag)
+    assert etag_matches(_request(f'"other", W/"again",  {etag}'), etag)
+    assert etag_matches(_request("*"), etag)
+    assert not etag_matches(_request('"other", W/"again"'), etag)
+    assert not etag_matches(_request(make_etag("companies", 4)), etag)
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "versions.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        create_version_triggers(conn)
+        conn.execute(text("INSERT INTO companies (email, name) VALUES ('co@x.it', 'Acme')"))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(async_engine)
+
+    async def get_db():
+        async with sessions() as session:
+            yield session
+
+    app = FastAPI()
+
+    @app.get("/companies")
+    async def list_companies(request: Request, response: Response, db=Depends(get_db)):
+        # Stesso schema degli endpoint di lista dei router
+        etag = make_etag("companies", await table_version(db, "companies"), query_key(request))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return [dict(row) for row in (await db.execute(text("SELECT id, name, version FROM companies"))).mappings()]
+
+    with TestClient(app) as client:
+        yield client, engine
+    engine.dispose()
+
+def test_version_trigger_bump_invalidates_etag(client):
+    client, engine = client
+    first = client.get("/companies")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.json()[0]["version"] == 1
+
+    assert client.get("/companies", headers={"If-None-Match": etag}).status_code == 304
+    # Parametri diversi, ETag diverso
+    assert client.get("/companies?fields=name", headers={"If-None-Match": etag}).status_code == 200
+
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE companies SET name = 'Acme 2' WHERE email = 'co@x.it'"))
+    changed = client.get("/companies", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()[0]["version"] == 2
+    assert client.get("/companies", headers={"If-None-Match": changed.headers["ETag"]}).status_code == 304
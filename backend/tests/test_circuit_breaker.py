@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+import llm_gateway
+from llm_gateway import CircuitBreaker, LLMGateway
+from llm_cache import LLMCache
+from singleflight import SingleFlight
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_gateway.time, "monotonic", clock.monotonic)
+    return clock
+
+def test_open_half_open_closed(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    # Una sola chiamata di prova alla volta
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+def test_cancelled_trial_is_released(clock):
+    async def scenario():
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30)
+        gateway = LLMGateway(api_key="test", cache=LLMCache(persist=False), singleflight=SingleFlight(), breaker=breaker)
+        breaker.record_failure()
+        clock.now += 30
+
+        async def hang(**kwargs):
+            await asyncio.sleep(10)
+
+        gateway.client.chat.completions.create = hang
+        trial = asyncio.create_task(gateway._call_with_retries([{"role": "user", "content": "x"}], "gpt-4"))
+        await asyncio.sleep(0)
+        assert not breaker.allow()
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        await gateway._http.aclose()
+        return breaker
+
+    breaker = asyncio.run(scenario())
+    assert breaker.state == "half_open"
+    assert breaker.allow()
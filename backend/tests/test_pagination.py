@@ -0,0 +1,37 @@
+import asyncio
+from fastapi import Response
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from database import Base, CompanyModel
+from pagination import NEXT_CURSOR_HEADER, keyset_page
+
+def _page(path, after=None, limit=None):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            async with async_sessionmaker(engine)() as db:
+                response = Response()
+                query = select(CompanyModel.id, CompanyModel.email)
+                rows = await keyset_page(db, query, CompanyModel.id, after, limit, response, scalars=False)
+                return [row[0] for row in rows], response.headers.get(NEXT_CURSOR_HEADER)
+        finally:
+            await engine.dispose()
+    return asyncio.run(scenario())
+
+def test_keyset_page_is_opt_in(tmp_path):
+    path = tmp_path / "pages.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for i in range(1, 121):
+            conn.execute(text("INSERT INTO companies (id, email) VALUES (:id, :email)"), {"id": i, "email": f"c{i}@x.it"})
+    engine.dispose()
+
+    # Senza limit la lista è completa e non c'è cursore
+    assert _page(path) == (list(range(1, 121)), None)
+    assert _page(path, after=100) == (list(range(101, 121)), None)
+
+    first, cursor = _page(path, limit=50)
+    assert first == list(range(1, 51)) and cursor == "50"
+    rest, cursor = _page(path, after=int(cursor), limit=100)
+    assert rest == list(range(51, 121)) and cursor is None
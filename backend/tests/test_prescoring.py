@@ -0,0 +1,60 @@
+import random
+import numpy as np
+import prescoring
+from prescoring import FreelancerPrescorer, parse_budget
+from skill_index import SkillIndex
+from vector_index import VectorIndex
+
+SKILLS = ["python", "go", "rust", "llm development", "prompt engineering", "react", "sql", "docker"]
+
+def test_parse_budget():
+    assert parse_budget({"budget": 800}) == 800.0
+    assert parse_budget({"budget_range": "1,5k"}) == 1500.0
+    assert parse_budget({"budget_range": "1.5k"}) == 1500.0
+    assert parse_budget({"budget_range": "1,500"}) == 1500.0
+    assert parse_budget({"budget_range": "500 - 1,500 EUR"}) == 1500.0
+    assert parse_budget({"budget_range": "$2k-5K"}) == 5000.0
+    assert parse_budget({"budget_range": "da concordare"}) is None
+    assert parse_budget({}) is None
+
+def _catalog(monkeypatch, size: int = 400) -> FreelancerPrescorer:
+    rng = random.Random(7)
+    skills = SkillIndex()
+    vectors = VectorIndex("freelancer")
+    monkeypatch.setattr(prescoring, "skill_index", skills)
+    monkeypatch.setattr(prescoring, "freelancer_index", vectors)
+
+    prescorer = FreelancerPrescorer()
+    texts = []
+    for freelancer_id in range(1, size + 1):
+        owned = rng.sample(SKILLS, rng.randint(0, 4))
+        skills.update(freelancer_id, owned)
+        texts.append(" ".join(owned) + rng.choice([" chatbot", " backend api", " data pipeline", ""]))
+        prescorer.update(
+            freelancer_id,
+            rng.choice([None, 20.0, 45.0, 80.0, 150.0]),
+            rng.choice([None, "full time", "part time", "busy"]),
+            rng.choice([None, "", "2 years", "5 years", "12 years", "junior"])
+        )
+    vectors._ids = np.arange(1, size + 1, dtype=np.int64)
+    vectors._matrix = vectors.embedder.embed(texts)
+    vectors._positions = {entity_id: position for position, entity_id in enumerate(range(1, size + 1))}
+    return prescorer
+
+def test_score_pruning_matches_unpruned_top_k(monkeypatch):
+    prescorer = _catalog(monkeypatch)
+    projects = [
+        {"title": "Chatbot", "description": "LLM chatbot", "required_skills": ["python", "llm development"], "budget_range": "4k", "timeline": "2 months"},
+        {"title": "API", "description": "backend api", "required_skills": ["go", "sql", "docker"], "budget": 500, "timeline": "1 week"},
+        {"title": "Rare", "description": "", "required_skills": ["rust"]},
+    ]
+    for project in projects:
+        for k in (1, 10, 50):
+            # Riferimento senza pruning: tutti i segnali per tutti i freelancer
+            reference = prescorer.prescore_for(project, range(1, 401))
+            expected = sorted(reference.values(), reverse=True)[:k]
+            top = prescorer.score(project, k=k)
+            assert len(top) == k
+            assert np.allclose([entry["prescore"] for entry in top], expected, atol=0.011)
+            for entry in top:
+                assert abs(entry["prescore"] - reference[entry["freelancer_id"]]) <= 0.011
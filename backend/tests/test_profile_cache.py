@@ -0,0 +1,35 @@
+from profile_cache import ProfileCache
+
+def test_fill_started_before_invalidate_is_dropped():
+    cache = ProfileCache()
+    generation = cache.generation("Freelancer", "a@x.it")
+    # Scrittura e invalidate arrivano mentre la lettura dal DB è in corso
+    cache.invalidate("Freelancer", ["a@x.it"])
+    cache.set("Freelancer", "a@x.it", '"old"', b"old", generation=generation)
+    assert cache.get("Freelancer", "a@x.it") is None
+
+    generation = cache.generation("Freelancer", "a@x.it")
+    cache.set("Freelancer", "a@x.it", '"new"', b"new", generation=generation)
+    assert cache.get("Freelancer", "a@x.it") == ('"new"', b"new")
+
+def test_invalidating_other_keys_does_not_block_fill():
+    cache = ProfileCache()
+    generation = cache.generation("Freelancer", "a@x.it")
+    cache.invalidate("Freelancer", ["b@x.it"])
+    cache.invalidate("Company", ["a@x.it"])
+    cache.set("Freelancer", "a@x.it", '"v1"', b"v1", generation=generation)
+    assert cache.get("Freelancer", "a@x.it") == ('"v1"', b"v1")
+
+def test_evicted_generations_stay_conservative():
+    cache = ProfileCache(max_entries=2)
+    generation = cache.generation("Freelancer", "a@x.it")
+    cache.invalidate("Freelancer", ["a@x.it"])
+    # La generazione di a@x.it esce dall'LRU: non deve tornare al valore letto prima
+    cache.invalidate("Freelancer", ["b@x.it", "c@x.it", "d@x.it"])
+    cache.set("Freelancer", "a@x.it", '"old"', b"old", generation=generation)
+    assert cache.get("Freelancer", "a@x.it") is None
+
+    generation = cache.generation("Freelancer", "b@x.it")
+    cache.clear()
+    cache.set("Freelancer", "b@x.it", '"old"', b"old", generation=generation)
+    assert cache.get("Freelancer", "b@x.it") is None
@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["ok"] * 5
+    assert calls == 1
+    assert stats == {"in_flight": 0, "upstream_calls": 1, "coalesced": 4}
+
+def test_waiter_survives_leader_cancellation():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "ok"
+
+        leader = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter, flight.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "ok"
+    assert stats["upstream_calls"] == 1
+
+def test_last_waiter_cancelled_cancels_the_call_and_frees_the_key():
+    async def scenario():
+        flight = SingleFlight()
+        started = []
+
+        async def fn():
+            started.append(True)
+            await asyncio.sleep(10)
+
+        only = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        only.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await only
+        # Chi arriva subito dopo avvia una chiamata nuova, non si unisce a quella annullata
+        assert flight.stats()["in_flight"] == 0
+
+        async def fresh():
+            return "fresh"
+
+        return await flight.do("k", fresh), len(started)
+
+    result, started = asyncio.run(scenario())
+    assert result == "fresh"
+    assert started == 1
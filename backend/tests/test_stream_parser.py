@@ -0,0 +1,51 @@
+import json
+import pytest
+from stream_parser import IncrementalJSONParser, validate_fields
+
+DOCUMENT = (
+    '{"match_score": 8.5, "summary": "Usa {graffe}, [parentesi] e \\"virgolette\\"",'
+    ' "path": "C:\\\\tmp\\\\", "unicode": "caff\\u00e8", "ok": true, "none": null,'
+    ' "skills": ["python", "a\\"b", {"nested": "}]"}], "detail": {"k": [1, 2, {"x": "\\\\"}]}, "last": -12}'
+)
+EXPECTED = json.loads(DOCUMENT)
+
+def _feed(chunks):
+    parser = IncrementalJSONParser()
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return parser, completed
+
+def test_every_two_chunk_split():
+    for cut in range(len(DOCUMENT) + 1):
+        parser, completed = _feed([DOCUMENT[:cut], DOCUMENT[cut:]])
+        assert completed == list(EXPECTED.items()), cut
+        assert parser.fields == EXPECTED
+        assert parser.close() == EXPECTED
+
+def test_character_by_character():
+    parser, completed = _feed(DOCUMENT)
+    assert completed == list(EXPECTED.items())
+
+def test_fields_are_reported_as_soon_as_they_complete():
+    parser = IncrementalJSONParser()
+    assert parser.feed('Ecco: {"match_score": 7') == []
+    # Un numero è completo solo alla virgola successiva
+    assert parser.feed(', "analysis": "te') == [("match_score", 7)]
+    assert parser.feed('sto \\') == []
+    assert parser.feed('"x\\"", "recommendations": [') == [("analysis", 'testo "x"')]
+    assert parser.feed('"a"]}') == [("recommendations", ["a"])]
+
+def test_close_accepts_fenced_json_and_rejects_garbage():
+    parser, _ = _feed(['```json\n{"a": 1}\n```'])
+    assert parser.close() == {"a": 1}
+    parser, _ = _feed(["nessun oggetto"])
+    with pytest.raises(ValueError):
+        parser.close()
+
+def test_validate_fields():
+    assert validate_fields({"score": 5, "ok": True}, {"score": (int, float), "ok": bool})
+    with pytest.raises(ValueError):
+        validate_fields({"score": True}, {"score": (int, float)})
+    with pytest.raises(ValueError):
+        validate_fields({}, {"score": (int, float)})
@@ -0,0 +1,261 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import re
+import zlib
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+from database import SessionLocal, EmbeddingModel, FreelancerModel, ProjectModel
+
+logger = logging.getLogger(__name__)
+
+class Embedder(ABC):
+    """
+    Base class for text embedders used by VectorIndex.
+
+    Subclasses set `name` and `dim` and implement `embed`, returning one
+    L2-normalized float32 row per input text.
+    """
+    name = "base"
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+class HashingEmbedder(Embedder):
+    """
+    Offline embedder: hashed unigrams and bigrams with sublinear TF weighting
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = re.findall(r"[a-z0-9\+#]+", text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: Dict[int, float] = {}
+            for feature in self._features(text):
+                # crc32 è stabile tra processi, a differenza di hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                index = h % self.dim
+                sign = 1.0 if (h >> 31) & 1 else -1.0
+                counts[index] = counts.get(index, 0.0) + sign
+            for index, value in counts.items():
+                matrix[row, index] = math.copysign(1.0 + math.log(abs(value)), value) if value else 0.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+def freelancer_text(skills: Optional[List[str]], experience: Optional[str], portfolio: Optional[List]) -> str:
+    parts = [experience or "", " ".join(skills or [])]
+    if isinstance(portfolio, str):
+        try:
+            portfolio = json.loads(portfolio)
+        except ValueError:
+            portfolio = []
+    for item in portfolio or []:
+        if isinstance(item, dict):
+            parts.append(item.get("title", ""))
+            parts.append(item.get("description", ""))
+            parts.append(" ".join(item.get("technologies", []) or []))
+    return "\n".join(p for p in parts if p)
+
+def project_text(title: Optional[str], description: Optional[str], required_skills: Optional[List[str]]) -> str:
+    return "\n".join(p for p in [title or "", description or "", " ".join(required_skills or [])] if p)
+
+class VectorIndex:
+    """
+    Brute-force cosine top-k over one kind of entity.
+
+    Vectors are persisted as float32 BLOBs in the `embeddings` table and
+    served from a single contiguous NumPy matrix, so a query is one matrix
+    multiply over the whole catalog.
+    """
+
+    def __init__(self, kind: str, embedder: Optional[Embedder] = None):
+        self.kind = kind
+        self.embedder = embedder or HashingEmbedder()
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def sync(self, items: Dict[int, str]) -> None:
+        """
+        Load stored vectors for `items` (entity_id -> text), embedding and
+        persisting only the entries that are missing or whose text changed
+        """
+        db = SessionLocal()
+        try:
+            stored = {
+                row.entity_id: row
+                for row in db.query(EmbeddingModel).filter(EmbeddingModel.kind == self.kind).all()
+            }
+            vectors: Dict[int, np.ndarray] = {}
+            stale: List[int] = []
+            for entity_id, text in items.items():
+                row = stored.get(entity_id)
+                if (
+                    row is not None
+                    and row.embedder == self.embedder.name
+                    and row.content_hash == self._content_hash(text)
+                ):
+                    vectors[entity_id] = np.frombuffer(row.vector, dtype=np.float32)
+                else:
+                    stale.append(entity_id)
+
+            if stale:
+                embedded = self.embedder.embed([items[entity_id] for entity_id in stale])
+                for entity_id, vector in zip(stale, embedded):
+                    vectors[entity_id] = vector
+                self._store(db, stale, items, embedded)
+            for entity_id in set(stored) - set(items):
+                db.delete(stored[entity_id])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        ids = sorted(vectors)
+        self._ids = np.array(ids, dtype=np.int64)
+        self._matrix = (
+            np.ascontiguousarray(np.vstack([vectors[i] for i in ids]), dtype=np.float32)
+            if ids else np.zeros((0, self.embedder.dim), dtype=np.float32)
+        )
+        self._positions = {entity_id: position for position, entity_id in enumerate(ids)}
+        logger.info(f"Vector index '{self.kind}' loaded: {len(ids)} vectors, {len(stale)} re-embedded")
+
+    async def upsert(self, entity_id: int, text: str) -> None:
+        await self.upsert_many({entity_id: text})
+
+    async def upsert_many(self, items: Dict[int, str]) -> None:
+        """
+        Embed and persist several entries (entity_id -> text) in one
+        transaction, growing the matrix once for all the new entries.
+        Embedding and the database write run in a worker thread; the
+        in-memory matrix is only touched from the event loop.
+        """
+        if not items:
+            return
+        entity_ids = list(items)
+        vectors = await asyncio.to_thread(self._embed_and_store, entity_ids, items)
+
+        new_ids: List[int] = []
+        new_vectors: List[np.ndarray] = []
+        for entity_id, vector in zip(entity_ids, vectors):
+            position = self._positions.get(entity_id)
+            if position is not None:
+                self._matrix[position] = vector
+            else:
+                self._positions[entity_id] = len(self._ids) + len(new_ids)
+                new_ids.append(entity_id)
+                new_vectors.append(vector)
+        if new_ids:
+            self._ids = np.append(self._ids, np.array(new_ids, dtype=np.int64))
+            self._matrix = np.ascontiguousarray(np.vstack([self._matrix, np.vstack(new_vectors)]), dtype=np.float32)
+
+    def _embed_and_store(self, entity_ids: List[int], items: Dict[int, str]) -> np.ndarray:
+        vectors = self.embedder.embed([items[entity_id] for entity_id in entity_ids])
+        db = SessionLocal()
+        try:
+            self._store(db, entity_ids, items, vectors)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return vectors
+
+    def _store(self, db, entity_ids: List[int], items: Dict[int, str], vectors: np.ndarray) -> None:
+        """
+        INSERT ... ON CONFLICT DO UPDATE on (kind, entity_id): two concurrent
+        upserts of the same entity (e.g. a profile save during a bulk import)
+        both succeed, the last one wins
+        """
+        table = EmbeddingModel.__table__
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["kind", "entity_id"],
+            set_={column: statement.excluded[column] for column in ("embedder", "content_hash", "vector")}
+        )
+        db.execute(statement, [
+            {
+                "kind": self.kind,
+                "entity_id": entity_id,
+                "embedder": self.embedder.name,
+                "content_hash": self._content_hash(items[entity_id]),
+                "vector": np.asarray(vector, dtype=np.float32).tobytes()
+            }
+            for entity_id, vector in zip(entity_ids, vectors)
+        ])
+
+    def vector_for(self, entity_id: int) -> Optional[np.ndarray]:
+        position = self._positions.get(entity_id)
+        return None if position is None else self._matrix[position]
+
+    def search_vector(self, query: np.ndarray, k: int = 10, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """
+        Return the top-k (entity_id, cosine similarity) pairs for a query vector
+        """
+        if not len(self._ids) or k <= 0:
+            return []
+        scores = self._matrix @ np.asarray(query, dtype=np.float32)
+        for entity_id in exclude:
+            position = self._positions.get(entity_id)
+            if position is not None:
+                scores[position] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def similarities(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return (entity_ids, cosine similarities) for every indexed entity
+        """
+        if not len(self._ids):
+            return self._ids, np.zeros(0, dtype=np.float32)
+        return self._ids, self._matrix @ self.embedder.embed([text])[0]
+
+    def search(self, text: str, k: int = 10, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        return self.search_vector(self.embedder.embed([text])[0], k=k, exclude=exclude)
+
+freelancer_index = VectorIndex("freelancer")
+project_index = VectorIndex("project")
+
+def rebuild_vector_indexes() -> None:
+    """
+    Sync both indexes with the freelancers and projects in the database
+    """
+    db = SessionLocal()
+    try:
+        freelancers = db.query(
+            FreelancerModel.id, FreelancerModel.skills, FreelancerModel.experience, FreelancerModel.portfolio
+        ).all()
+        projects = db.query(
+            ProjectModel.id, ProjectModel.title, ProjectModel.description, ProjectModel.required_skills
+        ).all()
+    finally:
+        db.close()
+
+    freelancer_index.sync({f.id: freelancer_text(f.skills, f.experience, f.portfolio) for f in freelancers})
+    project_index.sync({p.id: project_text(p.title, p.description, p.required_skills) for p in projects})